@@ -27,19 +27,59 @@ import tkinter.font as tkFont
 
 from sys import argv
 from sys import platform
+from sys import byteorder as sys_byteorder
+from sys import getsizeof
+from sys import version_info
 from os import getcwd
 from os import environ
 from os import listdir
 from os import path
+from os import cpu_count
+from os import stat
+from os import remove
+from os import replace as replace_file
+from os import getpid
 from math import log10
 from math import ceil as ceiling
 import shelve
+import zlib
+import pickle
+import hashlib
+import tracemalloc
+import sqlite3
+from time import sleep
+from time import time
+from time import perf_counter
+from functools import wraps
+from contextlib import contextmanager
+from collections import deque
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+import argparse
+import logging
+from logging.handlers import RotatingFileHandler
+import csv
+import json
+import base64
+import threading
+import socketserver
+from array import array
+from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import CancelledError
+from concurrent.futures import wait as wait_for_futures
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
 
 import matplotlib
 matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt  # must come after matplotlib.use('TkAgg')
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as FigureCanvas
 from matplotlib.figure import Figure
+import numpy as np
 from datetime import datetime
 
 # If using matplotlib 2+, make it look like matplotlib 1.5.x
@@ -82,6 +122,357 @@ except:
 
 r = robjects.r
 
+TRACE_EVENTS = 200000  # Timed calls kept for a Chrome trace file
+
+
+class Tracer():
+    '''Times the phases of PFunc's work (see traced): how often each ran,
+    how long it took in total, and a histogram of durations in powers of two
+    of microseconds. If keep_events is True, the most recent TRACE_EVENTS
+    timed calls are also kept for a Chrome trace file. While the tracer is
+    disabled, a traced function only checks the enabled flag.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.keep_events = False
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=TRACE_EVENTS)
+        self.clear_counters()
+
+    def clear_counters(self):
+        self.counts = {}
+        self.totals = {}
+        self.histograms = {}
+
+    def record(self, phase, start, duration):
+        '''Count one call of a phase that started at start (seconds since
+        the epoch) and lasted duration seconds.
+        '''
+        if memory.enabled and phase != 'R call':
+            memory.record(phase)
+        bucket = int(duration * 1e6).bit_length()
+        with self.lock:
+            self.counts[phase] = self.counts.get(phase, 0) + 1
+            self.totals[phase] = self.totals.get(phase, 0) + duration
+            histogram = self.histograms.setdefault(phase, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+            if self.keep_events:
+                self.events.append({'name': phase, 'ph': 'X',
+                                    'ts': start * 1e6, 'dur': duration * 1e6,
+                                    'pid': getpid(),
+                                    'tid': threading.get_ident()})
+
+    def snapshot(self):
+        '''Return the counters and events as plain values, and clear them.
+        This is how worker processes send their timings back (see merge).
+        '''
+        with self.lock:
+            snapshot = {'counts': self.counts, 'totals': self.totals,
+                        'histograms': self.histograms,
+                        'events': list(self.events)}
+            self.clear_counters()
+            self.events.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        '''Add the timings from another process's snapshot.'''
+        with self.lock:
+            for phase, count in snapshot['counts'].items():
+                self.counts[phase] = self.counts.get(phase, 0) + count
+                self.totals[phase] = (self.totals.get(phase, 0) +
+                                      snapshot['totals'][phase])
+                histogram = self.histograms.setdefault(phase, {})
+                for bucket, n in snapshot['histograms'][phase].items():
+                    histogram[bucket] = histogram.get(bucket, 0) + n
+            if self.keep_events:
+                self.events.extend(snapshot['events'])
+
+    def summary(self):
+        '''Describe each phase's timings on one line, slowest in total
+        first.
+        '''
+        lines = []
+        with self.lock:
+            phases = sorted(self.counts, key=lambda phase: -self.totals[phase])
+            for phase in phases:
+                count = self.counts[phase]
+                histogram = self.histograms[phase]
+                seen = 0
+                for bucket in sorted(histogram):
+                    seen += histogram[bucket]
+                    if seen >= 0.9 * count:
+                        break
+                lines.append('%s: %d calls, %s total, %s mean, 90%% under %s'
+                             % (phase, count,
+                                format_duration(self.totals[phase]),
+                                format_duration(self.totals[phase] / count),
+                                format_duration(2 ** bucket / 1e6)))
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, file_name):
+        '''Write the kept events as a Chrome trace file, for viewing in
+        chrome://tracing or Perfetto.
+        '''
+        summary = self.summary()
+        with self.lock:
+            events = list(self.events)
+        with open(file_name, 'w') as tracefile:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'summary': summary}}, tracefile)
+
+
+def format_duration(seconds):
+    '''Format a duration for the timing summary.'''
+    if seconds >= 1:
+        return '%.2f s' % seconds
+    if seconds >= 0.001:
+        return '%.1f ms' % (seconds * 1000)
+    return '%.0f us' % (seconds * 1e6)
+
+
+tracer = Tracer()
+
+
+def traced(phase):
+    '''Decorate a function so that the tracer times its calls as phase.'''
+    def decorate(function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            start = time()
+            began = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(phase, start, perf_counter() - began)
+        return timed
+    return decorate
+
+
+@traced('R call')
+def traced_r(code):
+    return robjects.r(code)
+
+
+MEMORY_TOP = 10  # Entries in each list of largest things in a memory report
+
+
+class MemoryProfiler():
+    '''Accounts for memory while enabled: the sizes of the Python heap
+    (from tracemalloc) and of R's heap (from gc()) at the end of each phase
+    that the tracer times, keeping the largest seen for each phase. Reading
+    R's heap means a garbage collection, so this is much slower than timing
+    alone.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.phases = {}
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.phases = {}
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        tracemalloc.stop()
+
+    def record(self, phase):
+        '''Note the heaps' sizes at the end of a phase.'''
+        python_bytes = tracemalloc.get_traced_memory()[0]
+        r_bytes = r_heap_bytes()
+        python_max, r_max = self.phases.get(phase, (0, 0))
+        self.phases[phase] = (max(python_max, python_bytes),
+                              max(r_max, r_bytes))
+
+    def heaps(self):
+        '''Describe the current sizes of the two heaps on one line.'''
+        python_bytes, python_peak = tracemalloc.get_traced_memory()
+        return ('Python heap %s (peak %s), R heap %s'
+                % (format_bytes(python_bytes), format_bytes(python_peak),
+                   format_bytes(r_heap_bytes())))
+
+    def report(self, footprints, top=MEMORY_TOP, this_process=True):
+        '''Describe memory use: the heaps now and at the end of each phase,
+        the total and average footprint of the individuals (as (name, R
+        bytes, Python bytes), see individual_footprint) with the largest of
+        them, and the largest R objects and Python allocation sites. Without
+        this_process, only the individuals are described, for a batch run in
+        which they were fit (and measured) in worker processes.
+        '''
+        lines = []
+        if this_process:
+            lines += [self.heaps(), '',
+                      'Largest heaps at the end of each phase:']
+            for phase, (python_bytes, r_bytes) in sorted(
+                    self.phases.items()):
+                lines.append('  %s: Python %s, R %s'
+                             % (phase, format_bytes(python_bytes),
+                                format_bytes(r_bytes)))
+            lines.append('')
+        if len(footprints) > 0:
+            total_r = sum(footprint[1] for footprint in footprints)
+            total_python = sum(footprint[2] for footprint in footprints)
+            lines += ['%d individuals: R %s, Python %s (about %s per '
+                      '1,000 individuals)'
+                      % (len(footprints), format_bytes(total_r),
+                         format_bytes(total_python),
+                         format_bytes(1000 * (total_r + total_python) /
+                                      len(footprints))),
+                      'Largest individuals:']
+            largest = sorted(footprints, key=lambda footprint:
+                             -(footprint[1] + footprint[2]))[:top]
+            for name, r_bytes, python_bytes in largest:
+                lines.append('  %s: R %s, Python %s'
+                             % (name, format_bytes(r_bytes),
+                                format_bytes(python_bytes)))
+            lines.append('')
+        if not this_process:
+            return '\n'.join(lines)
+        lines += ['Largest R objects:']
+        r_sizes = robjects.r('LargestObjects(%d)' % top)
+        for name, size in zip(r_sizes.names, r_sizes):
+            lines.append('  %s: %s' % (name, format_bytes(size)))
+        lines += ['', 'Largest Python allocations:']
+        for statistic in tracemalloc.take_snapshot().statistics(
+                'lineno')[:top]:
+            lines.append('  %s' % statistic)
+        return '\n'.join(lines)
+
+
+def format_bytes(n_bytes):
+    '''Format a size for a memory report.'''
+    if n_bytes >= 1024 ** 3:
+        return '%.2f GB' % (n_bytes / 1024 ** 3)
+    if n_bytes >= 1024 ** 2:
+        return '%.1f MB' % (n_bytes / 1024 ** 2)
+    return '%.0f kB' % (n_bytes / 1024)
+
+
+def r_heap_bytes():
+    return float(robjects.r('RHeapBytes()')[0])
+
+
+def individual_footprint(individual):
+    '''Return (name, R bytes, Python bytes) for a PrefFunc: what it keeps
+    in R (its fitted model in master.gam.list, its data frame and its
+    vectors) and its Python lists of trials.
+    '''
+    object_size = robjects.r['object.size']
+    r_bytes = float(robjects.r('object.size(master.gam.list[[%s]])'
+                               % individual.id_number)[0])
+    for vector in (individual.r_data_frame, individual.data_x,
+                   individual.data_y, individual.spline_x,
+                   individual.spline_y, individual.se,
+                   individual.broad_tolerance_points,
+                   individual.strict_tolerance_points):
+        r_bytes += float(object_size(vector)[0])
+    python_bytes = 0
+    for values in (individual.all_x, individual.all_y):
+        python_bytes += getsizeof(values) + sum(getsizeof(value)
+                                                for value in values)
+    return individual.name, r_bytes, python_bytes
+
+
+memory = MemoryProfiler()
+
+
+def set_tracing(enabled, keep_events=False):
+    '''Turn the tracer on or off. While it is on, every call to R through
+    the module's r is timed as well.
+    '''
+    global r
+    tracer.enabled = enabled
+    tracer.keep_events = keep_events
+    if enabled:
+        r = traced_r
+    else:
+        r = robjects.r
+
+
+LOG_RECORDS = 10000  # Messages kept in the message log
+LOG_FILE_BYTES = 1000000  # Size at which a --log file is rotated
+LOG_FILE_BACKUPS = 5  # Rotated --log files that are kept
+
+
+class MessageLog():
+    '''The message log: the last LOG_RECORDS messages, kept in a ring buffer
+    so that adding one takes the same time however long the log has grown.
+    Each message is a record (a dict) with its time, its code (its number in
+    MainApp.message_lookup, or None), the name of the individual and the
+    duration in seconds that it is about (or None), and its text.
+
+    Listeners (see subscribe) are given each new record, so an open
+    PFuncMessages window only has to add one line. With log_to_file, the
+    records are also written to a file as JSON lines, through a
+    RotatingFileHandler, for long batch, watch and service runs.
+    '''
+    def __init__(self, size=LOG_RECORDS):
+        self.size = size
+        self.records = deque(maxlen=size)
+        self.listeners = []
+        self.lock = threading.Lock()  # Service requests log from threads
+        self.logger = None
+
+    def add(self, text, code=None, individual=None, duration=None):
+        record = {'time': time(), 'code': code, 'individual': individual,
+                  'duration': duration, 'text': text}
+        with self.lock:
+            self.records.append(record)
+            listeners = list(self.listeners)
+        if self.logger is not None:
+            self.logger.info(json.dumps(record))
+        for listener in listeners:
+            listener(record)
+        return record
+
+    def subscribe(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def lines(self):
+        '''Return every record in the log as a line of text (see
+        format_record).
+        '''
+        with self.lock:
+            records = list(self.records)
+        return [format_record(record) for record in records]
+
+    def log_to_file(self, file_name):
+        '''Also write every record to file_name, starting a new file when it
+        reaches LOG_FILE_BYTES and keeping LOG_FILE_BACKUPS old ones.
+        '''
+        handler = RotatingFileHandler(file_name, maxBytes=LOG_FILE_BYTES,
+                                      backupCount=LOG_FILE_BACKUPS)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger('PFunc')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(handler)
+
+
+def format_record(record):
+    '''Format a message log record for the message log window: the time
+    (hours and minutes), the text, and the individual and duration if given.
+    '''
+    line = '%s %s' % (datetime.fromtimestamp(record['time']).strftime(
+        '%H:%M'), record['text'])
+    if record['individual'] is not None:
+        line += ' (%s)' % record['individual']
+    if record['duration'] is not None:
+        line += ' [%s]' % format_duration(record['duration'])
+    return line
+
+
+message_log = MessageLog()
+
 
 class PrefFunc():
     '''This is the base-level data structure for the program. Each PrefFunc
@@ -95,7 +486,8 @@ class PrefFunc():
                  sp_lim, sp_min, sp_max,
                  loc_peak, peak_min, peak_max,
                  tol_type, tol_drop, tol_absolute, tol_mode,
-                 tol_floor, strength_mode, spline_type='individual'):
+                 tol_floor, strength_mode, spline_type='individual',
+                 engine=None, sp_status='magenta', dataset=None):
         self.smoothing_value = smoothing_value
         self.current_sp = current_sp
         self.sp_lim = sp_lim
@@ -113,7 +505,11 @@ class PrefFunc():
         self.r_data_frame = r_data_frame
         self.id_number = id_number
         self.type = spline_type
-        self.sp_status = 'magenta'  # magenta = default, cyan = adjusted
+        self.engine = engine
+        self.sp_status = sp_status  # magenta = default, cyan = adjusted
+        self.bootstrap = None  # Confidence intervals (see BootstrapSpline)
+        self.excluded = []  # Rows of r_data_frame left out of the spline
+        self.dataset = None  # Set below, once the name is known
         self.update()
         self.name = r('names(%s)[2]' % self.r_data_frame.r_repr())[0]
         self.data_x = r('curr.func$data.x')
@@ -125,44 +521,192 @@ class PrefFunc():
             self.constituents = r('mydf')
             self.background = '#ffff99'
             self.name = r('names(%s)[3]' % self.r_data_frame.r_repr())[0]
+            self.all_x = []
+            self.all_y = []
+        else:
+            self.all_x = list(r('%s[, 1]' % self.r_data_frame.r_repr()))
+            self.all_y = list(r('%s[, 2]' % self.r_data_frame.r_repr()))
+        self.dataset = dataset
+        self.record()
+
+    @property
+    def sp_status(self):
+        '''Kept in the SmoothingStore, if the smoothing value comes from one.
+        Setting it also updates the individual's row of the dataset.
+        '''
+        if isinstance(self.smoothing_value, SmoothingValue):
+            value = self.smoothing_value
+            return value.store.status(value.id_number)
+        return self._sp_status
+
+    @sp_status.setter
+    def sp_status(self, status):
+        if isinstance(self.smoothing_value, SmoothingValue):
+            value = self.smoothing_value
+            value.store.set_status(value.id_number, status)
+        else:
+            self._sp_status = status
+        if getattr(self, 'dataset', None) is not None:
+            self.record()
 
     def update(self):
         self.generate_spline()
         self.populate_stats()
+        self.record()
 
-    def generate_spline(self):
+    def record(self):
+        '''Copy the measures into the cohort's columns (see PFuncDataset),
+        if the individual belongs to one.
+        '''
+        if self.dataset is not None:
+            self.dataset.store(self)
+
+    def peak_within(self):
+        '''Return the peak.within argument for R, based on the Find Local Peak
+        settings.
+        '''
+        if self.loc_peak.get() == 0:
+            instance_peak = '1'
+        elif self.loc_peak.get() == 1:
+            instance_peak = 'c(%s, %s)' % (self.peak_min.get(),
+                                           self.peak_max.get())
+        return instance_peak
+
+    def drop_and_floor(self):
+        '''Return the drop and tol.floor arguments for R, based on the
+        Tolerance settings.
+        '''
         if self.tol_type.get() == 'relative':
             instance_drop = self.tol_drop.get()
             instance_floor = self.tol_floor.get()
         elif self.tol_type.get() == 'absolute':
             instance_drop = 1
             instance_floor = self.tol_absolute.get()
-        if self.loc_peak.get() == 0:
-            instance_peak = '1'
-        elif self.loc_peak.get() == 1:
-            instance_peak = 'c(%s, %s)' % (self.peak_min.get(),
-                                           self.peak_max.get())
+        return instance_drop, instance_floor
+
+    def spline_engine(self):
+        '''Return the engine argument for R: 'tprs' for mgcv's thin plate
+        splines, or 'pspline' for the banded P-spline engine.
+        '''
+        if self.engine is None:
+            return 'tprs'
+        return self.engine.get()
+
+    @traced('fit')
+    def generate_spline(self):
+        instance_drop, instance_floor = self.drop_and_floor()
+        instance_peak = self.peak_within()
         if self.sp_status == 'magenta':
             self.reset_sp()
         if self.type == 'group':
             r("ind.data <- %s[2:3]" % self.r_data_frame.r_repr())
         else:
-            r("ind.data <- %s" % self.r_data_frame.r_repr())
+            r("ind.data <- %s" % self.fit_frame())
         r("""curr.func <- PFunc(ind.data, 2, %s, peak.within = %s,
                                 drop = %s, tol.mode = '%s',
                                 sp.binding = %d, min.sp = %s, max.sp = %s,
                                 graph.se = TRUE,
-                                forgui = TRUE, tol.floor = %s
+                                forgui = TRUE, tol.floor = %s,
+                                engine = '%s',
+                                warm.start = PreviousFit(master.gam.list, %s)
              )""" % (self.smoothing_value.get(),
                      instance_peak, instance_drop, self.tol_mode.get(),
                      self.sp_lim.get(), self.sp_min.get(), self.sp_max.get(),
-                     instance_floor))
-        r("master.gam.list[[%s]] <- curr.func$gam.object" % self.id_number)
+                     instance_floor, self.spline_engine(), self.id_number))
+        r("""master.gam.list[[%s]] <- curr.func$gam.object
+             master.range.list[[%s]] <- range(curr.func$data.x)
+             master.flat.list[[%s]] <- curr.func$is.flat
+          """ % (self.id_number, self.id_number, self.id_number))
+
+    def fit_frame(self):
+        '''Return the R data frame that the spline is fitted to: the
+        individual's data without its excluded trials.
+        '''
+        if len(self.excluded) == 0:
+            return self.r_data_frame.r_repr()
+        return '%s[-c(%s), ]' % (self.r_data_frame.r_repr(),
+                                 ', '.join(str(row) for row in self.excluded))
+
+    def toggle_trial(self, row):
+        '''Exclude one trial (a row of r_data_frame) from the spline, or
+        include it again if it was already excluded. Where the stimulus
+        levels stay the same, the previous fit is adjusted for the change
+        (see UpdateTrials in PFunc_RCode.R), so a refit at the same smoothing
+        value does not start from scratch.
+        Returns False if too few trials would remain.
+        '''
+        if row in self.excluded:
+            self.excluded.remove(row)
+            weight = 1
+        elif len(self.all_x) - len(self.excluded) > 3:
+            self.excluded.append(row)
+            self.excluded.sort()
+            weight = -1
+        else:
+            return False
+        r('''trial.frame <- %s
+             kept.frame <- %s
+             master.gam.list[[%s]] <- UpdateTrials(master.gam.list[[%s]],
+                                                   trial.frame[%s, 1],
+                                                   trial.frame[%s, 2], %s,
+                                                   kept.frame[, 1],
+                                                   kept.frame[, 2])
+          ''' % (self.r_data_frame.r_repr(), self.fit_frame(), self.id_number,
+                 self.id_number, row, row, weight))
+        self.update()
+        self.data_x = r('curr.func$data.x')
+        self.data_y = r('curr.func$data.y')
+        return True
+
+    def append_trials(self, r_data_frame):
+        '''Replace the individual's data with a longer data frame that has
+        new trials after the old ones, and refit. The previous fit is
+        extended with the new trials where possible (see AppendTrials in
+        PFunc_RCode.R). Excluded trials stay excluded.
+        '''
+        n_old = len(self.all_x)
+        self.r_data_frame = r_data_frame
+        self.all_x = list(r('%s[, 1]' % self.r_data_frame.r_repr()))
+        self.all_y = list(r('%s[, 2]' % self.r_data_frame.r_repr()))
+        r('''appended.frame <- %s
+             kept.frame <- %s
+             master.gam.list[[%s]] <- AppendTrials(master.gam.list[[%s]],
+                                                   appended.frame[-(1:%s), 1],
+                                                   appended.frame[-(1:%s), 2],
+                                                   kept.frame[, 1],
+                                                   kept.frame[, 2])
+          ''' % (self.r_data_frame.r_repr(), self.fit_frame(), self.id_number,
+                 self.id_number, n_old, n_old))
+        self.update()
+        self.data_x = r('curr.func$data.x')
+        self.data_y = r('curr.func$data.y')
+        self.bootstrap = None
+
+    def excluded_points(self):
+        '''Return the x and y values of the excluded trials.'''
+        return ([self.all_x[row - 1] for row in self.excluded],
+                [self.all_y[row - 1] for row in self.excluded])
 
+    def trial_influence(self):
+        '''Return leave-one-out diagnostics for each trial the spline is
+        fitted to (see TrialInfluence in PFunc_RCode.R), as lists keyed by
+        column name.
+        '''
+        r('''trial.influence <- TrialInfluence(master.gam.list[[%s]], %s, %s)
+          ''' % (self.id_number, self.data_x.r_repr(),
+                 self.data_y.r_repr()))
+        influence = {}
+        for column in INFLUENCE_COLUMNS:
+            influence[column] = plain_values(r('trial.influence$%s' % column))
+        return influence
+
+    @traced('convert')
     def populate_stats(self):
         self.spline_x = r('curr.func$stimulus')
         self.spline_y = r('curr.func$response')
         self.se = r('curr.func$se')
+        self.mini_index = [i - 1 for i in r(
+            'which(curr.func$grid.weight > grid.resolution[["mini"]])')]
         self.peak_pref = ('%s' % r('curr.func$peak.preference')).split()[1]
         self.peak_resp = ('%s' % r('curr.func$peak.response')).split()[1]
         self.broad_tolerance = ('%s' % r('curr.func$broad.tol')).split()[1]
@@ -177,6 +721,55 @@ class PrefFunc():
         self.smoothing_value.set((
             '%s' % r('curr.func$smoothing.parameter')).split()[1])
         self.is_flat = r('curr.func$is.flat')
+        # What the fit depends on (see depends_on)
+        self.fit_sp = r('curr.func$smoothing.parameter')[0]
+        self.gcv_sp = r('curr.func$gcv.sp')[0]
+        self.peak_free = tuple(r('curr.func$peak.free'))
+
+    def spline_points(self, view='mega'):
+        '''Return the x, y and standard error values of the spline for
+        plotting. The mini view uses the coarser subset of the adaptive grid
+        (see AdaptiveGrid in PFunc_RCode.R).
+        '''
+        if view == 'mini':
+            return ([self.spline_x[i] for i in self.mini_index],
+                    [self.spline_y[i] for i in self.mini_index],
+                    [self.se[i] for i in self.mini_index])
+        return self.spline_x, self.spline_y, self.se
+
+    def export_points(self):
+        '''Return the x, y and standard error values of the spline at the
+        export resolution (see AdaptiveGrid in PFunc_RCode.R).
+        '''
+        r('''export.grid <- AdaptiveGrid(master.gam.list[[%s]],
+                                         master.range.list[[%s]][1],
+                                         master.range.list[[%s]][2],
+                                         grid.resolution[["export"]],
+                                         se.fit = TRUE)
+          ''' % (self.id_number, self.id_number, self.id_number))
+        return (list(r('export.grid$stimulus')), list(r('export.grid$fit')),
+                list(r('export.grid$se.fit')))
+
+    @traced('bootstrap')
+    def bootstrap_intervals(self, n_boot, seed):
+        '''Return 95% confidence intervals for the peak and the tolerances
+        from n_boot simulated replicate splines (see BootstrapSpline in
+        PFunc_RCode.R), as pairs of strings keyed by measure.
+        '''
+        instance_drop, instance_floor = self.drop_and_floor()
+        r('''boot.intervals <- BootstrapSpline(master.gam.list[[%s]],
+                                               master.range.list[[%s]][1],
+                                               master.range.list[[%s]][2],
+                                               %s, %s, %s, %s, %s, %s)
+          ''' % (self.id_number, self.id_number, self.id_number, n_boot, seed,
+                 self.peak_within(), instance_drop, instance_floor,
+                 self.is_flat.r_repr()))
+        intervals = {}
+        for measure in ('peak.preference', 'peak.response',
+                        'broad.tolerance', 'strict.tolerance'):
+            intervals[measure] = list(r('GuiFormat(boot.intervals$%s)'
+                                        % measure))
+        return intervals
 
     def stiffen(self):
         '''Increase the smoothing parameter'''
@@ -209,16 +802,13 @@ class PrefFunc():
         new_sp_val = round(10 ** (round_log_sp_val + by), 6)
         return str(new_sp_val)
 
+    @traced('peak')
     def update_peak(self):
         '''Update just the peak of the preference function, without running the
         whole PFunc function in R again.
         '''
         previous_peak = self.peak_pref
-        if self.loc_peak.get() == 0:
-            instance_peak = '1'
-        elif self.loc_peak.get() == 1:
-            instance_peak = 'c(%s, %s)' % (self.peak_min.get(),
-                                           self.peak_max.get())
+        instance_peak = self.peak_within()
         peak_bundle = r('''Peak(input.stimuli = %s,
                                 preference.function = master.gam.list[[%s]],
                                 peak.within = %s,
@@ -231,19 +821,16 @@ class PrefFunc():
                                    % peak_bundle.r_repr())).split()[1]
         self.peak_resp = ('%s' % r('%s$peak.response'
                                    % peak_bundle.r_repr())).split()[1]
+        self.record()
         if self.tol_mode.get() == 'strict' and previous_peak != self.peak_pref:
             self.update_tolerance()
 
+    @traced('tolerance')
     def update_tolerance(self):
         '''Update just the tolerance of the preference function, without
         running the whole PFunc function in R again.
         '''
-        if self.tol_type.get() == 'relative':
-            instance_drop = self.tol_drop.get()
-            instance_floor = self.tol_floor.get()
-        elif self.tol_type.get() == 'absolute':
-            instance_drop = 1
-            instance_floor = self.tol_absolute.get()
+        instance_drop, instance_floor = self.drop_and_floor()
         r('''temp.stim.values <- data.frame(stimulus = %s)
              temp.peak.bundle <- list(peak.preference = %s,
                                       peak.response = %s,
@@ -277,6 +864,1001 @@ class PrefFunc():
                                    % tolerance_bundle.r_repr())
         self.tolerance_height = ('%s' % r('%s$tolerance.height'
                                    % tolerance_bundle.r_repr())).split()[1]
+        self.record()
+
+    def depends_on(self, setting):
+        '''Return True if changing a setting (the name of one of the GUI's
+        settings variables, e.g. 'sp_max') could change this individual's
+        fit, given its current value. Only the Smoothing Limits and the
+        Find Local Peak window are tracked; anything else counts as a
+        dependency.
+        '''
+        if setting in ('sp_lim', 'sp_min', 'sp_max'):
+            return self.limited_sp() != self.fit_sp
+        if setting in ('loc_peak', 'peak_min', 'peak_max'):
+            window_min, window_max = self.peak_window()
+            return not (window_min < self.peak_free[0] and
+                        window_max > self.peak_free[1])
+        return True
+
+    def limited_sp(self):
+        '''Return the smoothing value that refitting with the current
+        Smoothing Limits would use (see SPBinding in PFunc_RCode.R). Only the
+        default (GCV) value is limited.
+        '''
+        if self.sp_status != 'magenta':
+            return self.fit_sp
+        sp = self.gcv_sp
+        if self.sp_lim.get() == 1:
+            if sp > float(self.sp_max.get()):
+                sp = float(self.sp_max.get())
+            if sp < float(self.sp_min.get()):
+                sp = float(self.sp_min.get())
+        return sp
+
+    def peak_window(self):
+        '''Return the stimulus interval that the peak is looked for in, with
+        infinite ends for the whole stimulus range (see peak_within).
+        '''
+        if self.loc_peak.get() == 1:
+            ends = [float(self.peak_min.get()), float(self.peak_max.get())]
+            return min(ends), max(ends)
+        return -float('inf'), float('inf')
+
+    def set_peak(self, peak_pref, peak_resp, peak_free=None):
+        '''Store a peak that was computed for the whole cohort at once.
+        Returns True if the peak preference changed.
+        '''
+        previous_peak = self.peak_pref
+        self.peak_pref = peak_pref
+        self.peak_resp = peak_resp
+        if peak_free is not None:
+            self.peak_free = peak_free
+        self.record()
+        return previous_peak != self.peak_pref
+
+    def set_tolerance(self, broad_tolerance, strict_tolerance,
+                      broad_tolerance_points, strict_tolerance_points,
+                      tolerance_height):
+        '''Store a tolerance that was computed for the whole cohort at once.'''
+        self.broad_tolerance = broad_tolerance
+        self.strict_tolerance = strict_tolerance
+        self.broad_tolerance_points = broad_tolerance_points
+        self.strict_tolerance_points = strict_tolerance_points
+        self.tolerance_height = tolerance_height
+        self.record()
+
+
+# Measures compared between groups (see GroupDifferences in PFunc_RCode.R).
+COMPARISON_MEASURES = (('peak.preference', 'Peak preference'),
+                       ('peak.response', 'Peak height'),
+                       ('broad.tolerance', 'Broad tolerance'),
+                       ('strict.tolerance', 'Strict tolerance'),
+                       ('shape', 'Curve shape (RMS)'))
+PERMUTATION_CHUNK = 500  # Permutations per task sent to a worker
+# Columns of the results table, as (measure, heading, width in characters).
+# 'tolerance' follows the Tolerance settings (see ResultsTable).
+RESULTS_COLUMNS = (('name', 'Name', 14), ('peak_pref', 'Peak', 8),
+                   ('peak_resp', 'Height', 8), ('tolerance', 'Tolerance', 9),
+                   ('hd_strength', 'HD Strength', 11),
+                   ('hi_strength', 'HI Strength', 11),
+                   ('responsiveness', 'Responsiveness', 14),
+                   ('smoothing', 'Smoothing', 10), ('status', 'Status', 8))
+RESULTS_STATUSES = {'magenta': 'default', 'cyan': 'adjusted'}
+# Columns of the trial influence table (see TrialInfluence in PFunc_RCode.R).
+INFLUENCE_COLUMNS = ('stimulus', 'response', 'fitted', 'leverage',
+                     'loo.residual', 'cooks.distance')
+# The settings that affect fitting, with their default values. These are the
+# names of the corresponding variables in MainApp.
+DEFAULT_FIT_SETTINGS = {'sp_lim': 1, 'sp_min': '0.05', 'sp_max': '5',
+                        'loc_peak': 0, 'peak_min': 'min', 'peak_max': 'max',
+                        'tol_type': 'relative', 'tol_drop': '1/3',
+                        'tol_absolute': '1', 'tol_mode': 'broad',
+                        'tol_floor': '0', 'strength_mode': 'Height-Dependent',
+                        'spline_engine': 'tprs'}
+# The columns of a PFuncDataset: the measures of the Summary box, then the
+# bounds of the bootstrap confidence intervals.
+DATASET_MEASURES = ('peak_pref', 'peak_resp', 'broad_tolerance',
+                    'strict_tolerance', 'tolerance_height', 'hd_strength',
+                    'hi_strength', 'responsiveness', 'smoothing')
+DATASET_INTERVALS = (('peak_pref', 'peak.preference'),
+                     ('peak_height', 'peak.response'),
+                     ('broad_tolerance', 'broad.tolerance'),
+                     ('strict_tolerance', 'strict.tolerance'))
+BOOTSTRAP_SEED = 1
+BATCH_STORE = 'PFuncResults'  # Kept in the output directory for --append
+CHECKPOINT_STORE = 'PFuncCheckpoint.sqlite'  # Kept until a batch run ends
+SHARD_STORE = 'PFuncShard-%d-of-%d.pickle'  # One --shard's results
+SHARD_CHECKPOINT = 'PFuncCheckpoint-%d-of-%d.sqlite'  # Each --shard's own
+FIT_TIMEOUT = 600  # Seconds a batch fit may take before it is given up on
+FIT_CRASHES = 2  # Crashes of a fit running alone before it fails
+WATCH_STATE = 'PFuncWatch.sqlite'  # Kept in the directory given to --watch
+WATCH_EXTENSIONS = ('.csv', '.txt', '.tsv')
+WATCH_OUTPUTS = ('_spline_summaries.csv', '_spline_points.csv',
+                 '_tolerance_points.csv', '_failures.csv')
+WATCH_GROUP = 50  # Files whose individuals are fit together
+SERVICE_JOBS = 4  # Asynchronous jobs that the service runs at once
+SERVICE_FINISHED = 100  # Finished jobs whose results the service keeps
+
+
+class Setting():
+    '''A stand-in for the Tk variables that hold the GUI's settings. It has
+    the same get() and set() methods, so that PrefFunc can run without a Tk
+    interpreter, e.g. in batch mode and in worker processes.
+    '''
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class SmoothingStore():
+    '''The smoothing values and statuses of a cohort, as two arrays indexed
+    by id number ('-1' is the default, GCV value). It replaces a Tk
+    StringVar per individual: each individual holds a SmoothingValue with
+    the same get() and set() methods, so reading or writing a value never
+    goes through the Tcl interpreter. Only the displayed individual's value
+    is copied to the Tk entry, by a listener (see subscribe).
+
+    Changes made inside "with store.batch():" are reported to the listeners
+    once, at the end of the block, as one set of id numbers.
+    '''
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.values = np.full(capacity, '-1', dtype=object)
+        self.statuses = np.full(capacity, 'magenta', dtype=object)
+        self.listeners = []
+        self.pending = None  # The id numbers changed in the current batch
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        '''Remove every individual, but keep the listeners.'''
+        listeners = self.listeners
+        self.__init__()
+        self.listeners = listeners
+
+    def add(self, id_number, value='-1'):
+        '''Make room for an individual and return its SmoothingValue.'''
+        if id_number > len(self.values):
+            extra = max(id_number, 2 * len(self.values)) - len(self.values)
+            self.values = np.concatenate(
+                [self.values, np.full(extra, '-1', dtype=object)])
+            self.statuses = np.concatenate(
+                [self.statuses, np.full(extra, 'magenta', dtype=object)])
+        self.size = max(self.size, id_number)
+        self.values[id_number - 1] = value
+        self.statuses[id_number - 1] = 'magenta'
+        return SmoothingValue(self, id_number)
+
+    def get(self, id_number):
+        return self.values[id_number - 1]
+
+    def set(self, id_number, value):
+        self.values[id_number - 1] = value
+        self.changed([id_number])
+
+    def status(self, id_number):
+        return self.statuses[id_number - 1]
+
+    def set_status(self, id_number, status):
+        self.statuses[id_number - 1] = status
+        self.changed([id_number])
+
+    def set_many(self, values, status=None):
+        '''Set the values of several individuals at once, from a dict of id
+        number: value, and optionally their statuses too.
+        '''
+        ids = list(values.keys())
+        rows = np.array(ids, dtype=int) - 1
+        self.values[rows] = list(values.values())
+        if status is not None:
+            self.statuses[rows] = status
+        self.changed(ids)
+
+    def reset(self, ids=None):
+        '''Return individuals (all of them by default) to the default
+        value and status.
+        '''
+        if ids is None:
+            ids = range(1, self.size + 1)
+        self.set_many(dict.fromkeys(ids, '-1'), status='magenta')
+
+    def ids(self, status):
+        '''Return the id numbers of the individuals with a status.'''
+        return [row + 1 for row in
+                np.flatnonzero(self.statuses[:self.size] == status)]
+
+    def subscribe(self, listener):
+        '''Call listener(ids) with the set of changed id numbers after each
+        change or batch of changes.
+        '''
+        self.listeners.append(listener)
+
+    @contextmanager
+    def batch(self):
+        outermost = self.pending is None
+        if outermost:
+            self.pending = set()
+        try:
+            yield self
+        finally:
+            if outermost:
+                changed, self.pending = self.pending, None
+                self.changed(changed)
+
+    def changed(self, ids):
+        if self.pending is not None:
+            self.pending.update(ids)
+        elif len(ids) > 0:
+            ids = set(ids)
+            for listener in self.listeners:
+                listener(ids)
+
+
+class SmoothingValue():
+    '''One individual's place in a SmoothingStore, with the get() and set()
+    methods of the Tk variable that it replaces.
+    '''
+    __slots__ = ('store', 'id_number')
+
+    def __init__(self, store, id_number):
+        self.store = store
+        self.id_number = id_number
+
+    def get(self):
+        return self.store.get(self.id_number)
+
+    def set(self, value):
+        self.store.set(self.id_number, value)
+
+
+class NameIndex():
+    '''The names of a cohort, for finding individuals by name as the user
+    types. Names are kept sorted (in lower case), so names that start with a
+    query are found by binary search. Names that contain it are found by
+    scanning one string of all the names, and typing more of the same query
+    only checks the names that matched before.
+    '''
+    def __init__(self):
+        self.keys = []  # (lower case name, id number), sorted
+        self.changed()
+
+    def changed(self):
+        self.text = None  # The names joined by newlines (see scan)
+        self.starts = []  # Where each name starts in text
+        self.last = (None, [])  # The last query and its positions in keys
+
+    def clear(self):
+        self.keys = []
+        self.changed()
+
+    def build(self, individuals):
+        '''Index a dict of id number: PrefFunc.'''
+        self.keys = sorted((individual.name.lower(), i)
+                           for i, individual in individuals.items())
+        self.changed()
+
+    def add(self, id_number, name):
+        insort(self.keys, (name.lower(), id_number))
+        self.changed()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, query):
+        '''Return the first and last + 1 positions in keys of the names that
+        start with query (in lower case).
+        '''
+        first = bisect_left(self.keys, (query,))
+        last = bisect_left(self.keys, (query + '\uffff',))
+        return first, last
+
+    def scan(self, query):
+        '''Return the positions in keys of the names that contain query (in
+        lower case).
+        '''
+        if self.text is None:
+            self.text = '\n'.join(name for name, i in self.keys)
+            start = 0
+            for name, i in self.keys:
+                self.starts.append(start)
+                start += len(name) + 1
+        positions = []
+        at = self.text.find(query)
+        while at >= 0:
+            position = bisect_right(self.starts, at) - 1
+            positions.append(position)
+            if position + 1 == len(self.starts):
+                break
+            at = self.text.find(query, self.starts[position + 1])
+        return positions
+
+    def search(self, query):
+        '''Return the id numbers of the individuals whose names contain query,
+        ignoring case: those whose names start with it first, then the rest,
+        each in alphabetical order.
+        '''
+        query = query.lower()
+        last_query, last_positions = self.last
+        if last_query is not None and query.startswith(last_query):
+            positions = [p for p in last_positions if query in self.keys[p][0]]
+        else:
+            positions = self.scan(query)
+        self.last = (query, positions)
+        first, last = self.prefix_range(query)
+        return ([self.keys[p][1] for p in range(first, last)] +
+                [self.keys[p][1] for p in positions if p < first or p >= last])
+
+
+class FitResult():
+    '''The measures of one fitted individual as plain Python values, so that
+    they can be passed between processes. It has the attributes that the
+    output functions (write_summaries, write_points and
+    write_tolerance_points) read from PrefFunc.
+    '''
+    @traced('convert')
+    def __init__(self, individual):
+        self.id_number = individual.id_number
+        self.name = individual.name
+        self.type = individual.type
+        self.sp_status = individual.sp_status
+        self.smoothing_value = Setting(individual.smoothing_value.get())
+        self.peak_pref = individual.peak_pref
+        self.peak_resp = individual.peak_resp
+        self.broad_tolerance = individual.broad_tolerance
+        self.strict_tolerance = individual.strict_tolerance
+        self.broad_tolerance_points = plain_values(
+            individual.broad_tolerance_points)
+        self.strict_tolerance_points = plain_values(
+            individual.strict_tolerance_points)
+        self.tolerance_height = individual.tolerance_height
+        self.hd_strength = individual.hd_strength
+        self.hi_strength = individual.hi_strength
+        self.responsiveness = individual.responsiveness
+        self.points = individual.export_points()
+        self.bootstrap = individual.bootstrap
+        self.trace = None  # Timings from a worker process (see Tracer)
+        self.footprint = None  # See individual_footprint
+
+    def export_points(self):
+        return self.points
+
+
+def plain_values(r_vector):
+    '''Convert an R vector to a list of floats, with None for NA.'''
+    return [None if value is robjects.NA_Real else float(value)
+            for value in r_vector]
+
+
+def csv_value(value):
+    '''Format a number for the output files the way R prints it.'''
+    if value is None or value is robjects.NA_Real:
+        return 'NA'
+    return str(value)
+
+
+def dataset_number(value):
+    '''Convert a measure, as printed by R or as a number, to a float, with
+    NaN for NA.
+    '''
+    if value is None or value is robjects.NA_Real or value == 'NA':
+        return np.nan
+    return float(value)
+
+
+class PFuncDataset():
+    '''The measures of a cohort as columns: a numpy array for each of
+    DATASET_MEASURES and for the lower and upper bounds of each of
+    DATASET_INTERVALS, with NaN for NA, plus the names and smoothing
+    statuses. Row i - 1 belongs to the individual with id number i, unless
+    rows are given explicitly (see from_individuals). Individuals copy their
+    measures in whenever they change (see PrefFunc.record), so cohort-wide
+    summaries, filters and output can work on whole columns.
+    '''
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.version = 0  # Counts changes, for the cached orders
+        self.orders = {}  # See order
+        self.names = np.empty(capacity, dtype=object)
+        self.statuses = np.empty(capacity, dtype=object)
+        self.columns = {}
+        for measure in self.column_names():
+            self.columns[measure] = np.full(capacity, np.nan)
+        self.has_intervals = np.zeros(capacity, dtype=bool)
+
+    @staticmethod
+    def column_names():
+        names = list(DATASET_MEASURES)
+        for measure, r_measure in DATASET_INTERVALS:
+            names += [measure + '_lower', measure + '_upper']
+        return names
+
+    @classmethod
+    def from_individuals(cls, individuals):
+        '''Return a dataset with one row per individual (PrefFunc or
+        FitResult), in the order given.
+        '''
+        dataset = cls(max(1, len(individuals)))
+        for row, individual in enumerate(individuals):
+            dataset.store(individual, row)
+        return dataset
+
+    def clear(self):
+        version = self.version
+        self.__init__()
+        self.version = version + 1
+
+    def grow(self, capacity):
+        '''Make room for at least capacity rows, doubling as needed so that
+        adding rows one at a time stays cheap.
+        '''
+        old_capacity = len(self.names)
+        if capacity <= old_capacity:
+            return
+        new_capacity = max(capacity, 2 * old_capacity)
+        extra = new_capacity - old_capacity
+        self.names = np.concatenate([self.names,
+                                     np.empty(extra, dtype=object)])
+        self.statuses = np.concatenate([self.statuses,
+                                        np.empty(extra, dtype=object)])
+        for measure in self.columns:
+            self.columns[measure] = np.concatenate(
+                [self.columns[measure], np.full(extra, np.nan)])
+        self.has_intervals = np.concatenate([self.has_intervals,
+                                             np.zeros(extra, dtype=bool)])
+
+    def store(self, individual, row=None):
+        '''Copy an individual's measures into its row.'''
+        if row is None:
+            row = individual.id_number - 1
+        self.grow(row + 1)
+        self.size = max(self.size, row + 1)
+        self.version += 1
+        self.names[row] = individual.name
+        self.statuses[row] = individual.sp_status
+        for measure in DATASET_MEASURES[:-1]:
+            self.columns[measure][row] = dataset_number(
+                getattr(individual, measure))
+        self.columns['smoothing'][row] = dataset_number(
+            individual.smoothing_value.get())
+        self.has_intervals[row] = individual.bootstrap is not None
+        for measure, r_measure in DATASET_INTERVALS:
+            bounds = [np.nan, np.nan]
+            if individual.bootstrap is not None:
+                bounds = individual.bootstrap[r_measure]
+            self.columns[measure + '_lower'][row] = dataset_number(bounds[0])
+            self.columns[measure + '_upper'][row] = dataset_number(bounds[1])
+
+    def column(self, measure):
+        '''Return the filled part of a column (a view, not a copy).'''
+        return self.columns[measure][:self.size]
+
+    def tolerance(self, tol_mode):
+        return self.column('%s_tolerance' % tol_mode)
+
+    def strength(self, strength_mode):
+        if strength_mode == 'Height-Dependent':
+            return self.column('hd_strength')
+        return self.column('hi_strength')
+
+    def values(self, measure):
+        '''Like column, but also for 'name' and 'status'.'''
+        if measure == 'name':
+            return self.names[:self.size]
+        if measure == 'status':
+            return self.statuses[:self.size]
+        return self.column(measure)
+
+    def order(self, measure):
+        '''Return the rows sorted by a measure (see values), with NaN last.
+        Orders are kept until the dataset changes, so sorting and filtering
+        a large cohort again is cheap.
+        '''
+        if measure not in self.orders or \
+                self.orders[measure][0] != self.version:
+            self.orders[measure] = (self.version, np.argsort(
+                self.values(measure), kind='stable'))
+        return self.orders[measure][1]
+
+    def rows_between(self, measure, low, high):
+        '''Return the rows whose measure is between low and high, in order,
+        by binary search of the cached order (see order). Rows with NaN are
+        only left out when one of the bounds is finite; with both infinite,
+        every row is returned, NaN last.
+        '''
+        order = self.order(measure)
+        if low == -np.inf and high == np.inf:
+            return order
+        ordered = self.column(measure)[order]
+        first = np.searchsorted(ordered, low, side='left')
+        last = np.searchsorted(ordered, high, side='right')
+        return order[first:last]
+
+    def ids(self, mask):
+        '''Return the id numbers of the rows where mask is True, e.g.
+        dataset.ids(dataset.column('peak_pref') > 10).
+        '''
+        return [row + 1 for row in np.flatnonzero(mask[:self.size])]
+
+    def write_summaries(self, file_name, tol_mode, strength_mode):
+        '''Write the summaries csv file (see write_summaries), sending each
+        column to R in one piece.
+        '''
+        columns = [('peak_pref', self.column('peak_pref')),
+                   ('peak_height', self.column('peak_resp')),
+                   ('tolerance', self.tolerance(tol_mode)),
+                   ('strength', self.strength(strength_mode)),
+                   ('responsiveness', self.column('responsiveness')),
+                   ('smoothing', self.column('smoothing'))]
+        if self.has_intervals[:self.size].any():
+            for measure, r_measure in DATASET_INTERVALS[:2]:
+                for bound in ('_lower', '_upper'):
+                    columns.append((measure + bound,
+                                    self.column(measure + bound)))
+            for bound in ('_lower', '_upper'):
+                columns.append(('tolerance' + bound,
+                                self.column('%s_tolerance%s'
+                                            % (tol_mode, bound))))
+        robjects.globalenv['summary.names'] = robjects.StrVector(
+            list(self.names[:self.size]))
+        robjects.globalenv['summary.columns'] = robjects.ListVector(
+            [(name, robjects.FloatVector(values.tolist()))
+             for name, values in columns])
+        r('''output <- data.frame(name = summary.names,
+                                 lapply(summary.columns, function(column) {
+                                   column[is.nan(column)] <- NA
+                                   return(column)
+                                 }), stringsAsFactors = FALSE)
+             write.csv(output, '%s', row.names = FALSE)
+          ''' % file_name)
+
+
+def source_r_code():
+    '''Load PFunc_RCode.R into this process's R session. R works in the
+    folder PFunc was started from (on Windows, the folder of PFunc.py).
+    '''
+    current_directory = getcwd()
+    if platform == 'win32':
+        current_directory = path.dirname(path.realpath(argv[0]))
+        current_directory = current_directory.replace("\\", "/")
+    r("setwd('%s')" % current_directory)
+    r("source('PFunc_RCode.R')")
+
+
+def bootstrap_seed(seed, name):
+    '''Return the random seed for one individual's bootstrap replicates.
+    It depends only on the run's seed and the individual's name, so results
+    do not depend on the order in which individuals are fitted.
+    '''
+    return zlib.crc32(('%s/%s' % (seed, name)).encode()) % 2147483647
+
+
+def fit_task(id_number, name, stimulus, response, settings, smoothing='-1',
+             spline_type='individual', n_boot=0, seed=BOOTSTRAP_SEED):
+    '''Describe one individual for fit_individual, using only plain Python
+    values. smoothing is '-1' for the default (GCV) smoothing value.
+    '''
+    return {'id': id_number, 'name': name, 'type': spline_type,
+            'stimulus': list(stimulus), 'response': list(response),
+            'smoothing': smoothing, 'settings': dict(settings),
+            'bootstrap': n_boot, 'seed': bootstrap_seed(seed, name)}
+
+
+def individual_task(individual, settings, n_boot=0, seed=BOOTSTRAP_SEED):
+    '''Describe a PrefFunc for fit_individual (see fit_task).'''
+    smoothing = '-1'
+    if individual.sp_status == 'cyan':
+        smoothing = individual.smoothing_value.get()
+    return fit_task(individual.id_number, individual.name,
+                    individual.data_x, individual.data_y, settings,
+                    smoothing=smoothing, spline_type=individual.type,
+                    n_boot=n_boot, seed=seed)
+
+
+@traced('parse')
+def read_tasks(file_name, settings, columns=None, n_boot=0,
+               seed=BOOTSTRAP_SEED, detect=False):
+    '''Read a horizontal data file, or a vertical one if columns names its
+    id, stimulus and response columns, and return one fit_task per
+    individual. If detect is True, a file without those columns is read as
+    a horizontal file.
+    '''
+    robjects.globalenv['data.file.name'] = robjects.StrVector([file_name])
+    r('batch.data <- ReadDataFile(data.file.name)')
+    if columns is not None and detect:
+        if not set(columns) <= set(r('names(batch.data)')):
+            columns = None
+    if columns is None:
+        r('batch.individuals <- SplitIndividuals(batch.data)')
+    else:
+        robjects.globalenv['data.columns'] = robjects.StrVector(columns)
+        r('''batch.individuals <- SplitIndividuals(
+               batch.data, data.columns[1], data.columns[2], data.columns[3])
+          ''')
+    tasks = []
+    for i in range(1, int(r('length(batch.individuals)')[0]) + 1):
+        tasks.append(fit_task(
+            i, r('names(batch.individuals[[%d]])[2]' % i)[0],
+            r('batch.individuals[[%d]][, 1]' % i),
+            r('batch.individuals[[%d]][, 2]' % i), settings,
+            n_boot=n_boot, seed=seed))
+    return tasks
+
+
+def fit_individual(task):
+    '''Fit one individual described by fit_task in this process's R session
+    and return a FitResult, with confidence intervals if the task asks for
+    bootstrap replicates. This is what the worker processes of a FitPool run.
+    If the task asks for a trace, the worker's timings are sent back with the
+    result.
+    '''
+    if task.get('trace', False):
+        set_tracing(True, keep_events=True)
+    settings = {}
+    for name, value in task['settings'].items():
+        settings[name] = Setting(value)
+    robjects.globalenv['task.stimulus'] = robjects.FloatVector(
+        task['stimulus'])
+    robjects.globalenv['task.response'] = robjects.FloatVector(
+        task['response'])
+    robjects.globalenv['task.name'] = robjects.StrVector([task['name']])
+    r('''task.df <- IndividualFrame(task.stimulus, task.response, task.name)
+         master.gam.list <- list()
+         master.range.list <- list()
+         master.flat.list <- list()
+         range.bundle <- rep(NA, 4)
+      ''')
+    # A status of 'none' fits once with the given smoothing value (-1 means
+    # GCV) instead of resetting it first.
+    individual = PrefFunc(
+        r('task.df'), task['id'], Setting(task['smoothing']), Setting(''),
+        settings['sp_lim'], settings['sp_min'], settings['sp_max'],
+        settings['loc_peak'], settings['peak_min'], settings['peak_max'],
+        settings['tol_type'], settings['tol_drop'], settings['tol_absolute'],
+        settings['tol_mode'], settings['tol_floor'], settings['strength_mode'],
+        engine=settings['spline_engine'], sp_status='none')
+    if task['smoothing'] == '-1':
+        individual.sp_status = 'magenta'
+    else:
+        individual.sp_status = 'cyan'
+    if task['bootstrap'] > 0:
+        individual.bootstrap = individual.bootstrap_intervals(
+            task['bootstrap'], task['seed'])
+    result = FitResult(individual)
+    result.type = task['type']
+    if task.get('trace', False):
+        result.trace = tracer.snapshot()
+    if task.get('memory', False):
+        result.footprint = individual_footprint(individual)
+    return result
+
+
+def failure_reason(error):
+    '''Describe the error that stopped a fit, for a failures report.'''
+    return str(error).strip() or error.__class__.__name__
+
+
+class FitPool():
+    '''A pool of worker processes for fitting. Each worker has its own R
+    session with PFunc_RCode.R already loaded, so a task only has to fit.
+    timeout is the number of seconds that isolated_imap lets one task run
+    (None for no limit).
+    '''
+    def __init__(self, workers=None, timeout=None):
+        if workers is None:
+            workers = cpu_count()
+        self.workers = workers
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.start()
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=get_context('spawn'),
+                                            initializer=source_r_code)
+        self.generation += 1
+
+    def restart(self, generation=None):
+        '''Stop every worker, even one that is stuck inside R, and start
+        fresh ones. If generation is given, this is skipped when the workers
+        have already been restarted since then (e.g. by another thread).
+        '''
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if version_info >= (3, 14):
+                self.executor.kill_workers()
+            else:  # No public way to do this before Python 3.14
+                for process in list((self.executor._processes or
+                                     {}).values()):
+                    process.kill()
+            if version_info >= (3, 9):
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            else:  # shutdown has no cancel_futures before Python 3.9
+                for work_item in list(
+                        self.executor._pending_work_items.values()):
+                    work_item.future.cancel()
+                self.executor.shutdown(wait=False)
+            self.start()
+
+    def map(self, function, tasks):
+        '''Run function on every task and return the results in the same
+        order as the tasks.
+        '''
+        return list(self.imap(function, tasks))
+
+    def imap(self, function, tasks):
+        '''Like map, but yield each result as soon as it and those of the
+        tasks before it are done.
+        '''
+        tasks = list(tasks)
+        chunksize = max(1, len(tasks) // (4 * self.workers))
+        return self.executor.map(function, tasks, chunksize=chunksize)
+
+    def isolated_imap(self, function, tasks):
+        '''Like imap, but a task that fails does not stop the others. Yield
+        (task, result, reason) for every task in order, where result is None
+        and reason says why for a task that failed. A task that raises an
+        error fails. A task that runs longer than the pool's timeout fails,
+        and the workers are restarted to stop it. If a worker process dies,
+        the workers are restarted. If several tasks were running, any of
+        them could have caused it, so each is run again on its own; a crash
+        only counts against a task that was running alone, and a task fails
+        after FIT_CRASHES of those. Tasks cut short by a restart from another
+        thread are simply run again.
+        '''
+        tasks = list(tasks)
+        waiting = list(range(len(tasks) - 1, -1, -1))
+        running = {}
+        outcomes = {}
+        crashes = {}
+        suspects = set()
+        next_index = 0
+        while next_index < len(tasks):
+            while len(waiting) > 0 and len(running) < self.workers:
+                if len(running) > 0 and (waiting[-1] in suspects or any(
+                        index in suspects for index, deadline, generation
+                        in running.values())):
+                    break  # A suspect runs alone
+                index = waiting.pop()
+                deadline = None
+                if self.timeout:
+                    deadline = time() + self.timeout
+                generation = self.generation
+                try:
+                    with self.lock:
+                        future = self.executor.submit(function, tasks[index])
+                        generation = self.generation
+                except BrokenProcessPool:
+                    waiting.append(index)
+                    self.restart(generation=generation)
+                    continue
+                running[future] = (index, deadline, generation)
+            deadlines = [deadline for index, deadline, generation
+                         in running.values() if deadline is not None]
+            wait_time = None
+            if len(deadlines) > 0:
+                wait_time = max(0, min(deadlines) - time())
+            done = wait_for_futures(list(running), timeout=wait_time,
+                                    return_when=FIRST_COMPLETED)[0]
+            current = self.generation
+            stuck = []
+            broken = []
+            for future in done:
+                index, deadline, generation = running.pop(future)
+                try:
+                    outcomes[index] = (future.result(), None)
+                except (BrokenProcessPool, CancelledError):
+                    if generation == current:
+                        broken.append(index)
+                    else:
+                        waiting.append(index)
+                except Exception as error:
+                    outcomes[index] = (None, failure_reason(error))
+            now = time()
+            for future, (index, deadline, generation) in list(running.items()):
+                if deadline is not None and deadline <= now:
+                    del running[future]
+                    if generation == current:
+                        stuck.append(index)
+                    else:
+                        waiting.append(index)
+            if len(stuck) > 0 or len(broken) > 0:
+                alone = (len(broken) == 1 and len(stuck) == 0 and
+                         len(running) == 0)
+                for index in stuck:
+                    outcomes[index] = (None, 'took longer than %s seconds'
+                                       % self.timeout)
+                for future, (index, deadline, generation) in running.items():
+                    if not future.done() or future.cancelled():
+                        waiting.append(index)
+                    elif future.exception() is None:
+                        outcomes[index] = (future.result(), None)
+                    elif isinstance(future.exception(), BrokenProcessPool):
+                        broken.append(index)
+                    else:
+                        outcomes[index] = (
+                            None, failure_reason(future.exception()))
+                for index in broken:
+                    if not alone:
+                        suspects.add(index)
+                        waiting.append(index)
+                        continue
+                    crashes[index] = crashes.get(index, 0) + 1
+                    if crashes[index] >= FIT_CRASHES:
+                        outcomes[index] = (None, 'its worker process crashed')
+                    else:
+                        waiting.append(index)
+                running.clear()
+                self.restart(generation=current)
+            while next_index in outcomes:
+                result, reason = outcomes.pop(next_index)
+                yield tasks[next_index], result, reason
+                next_index += 1
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.shutdown()
+
+
+def permutation_chunk(task):
+    '''Compute the group differences for one chunk of random relabellings
+    (see PermutationDifferences in PFunc_RCode.R). This is what the worker
+    processes of a FitPool run for compare_groups.
+    '''
+    robjects.globalenv['chunk.stimulus'] = robjects.FloatVector(
+        task['stimulus'])
+    robjects.globalenv['chunk.fits'] = robjects.r['matrix'](
+        robjects.FloatVector(task['fits']), nrow=len(task['stimulus']))
+    r('''chunk.differences <- PermutationDifferences(chunk.stimulus,
+                                                     chunk.fits, %s, %s, %s,
+                                                     %s, %s, %s)
+      ''' % (task['n_a'], task['n_perm'], task['seed'], task['peak_within'],
+             task['drop'], task['tol_floor']))
+    differences = {}
+    for measure, label in COMPARISON_MEASURES:
+        differences[measure] = plain_values(r('chunk.differences$%s'
+                                              % measure))
+    return differences
+
+
+def compare_groups(pool, individuals_a, individuals_b, n_perm=10000,
+                   seed=BOOTSTRAP_SEED):
+    '''Test whether two groups of fitted individuals differ in the peak,
+    tolerance and shape of their mean curves. The curves are predicted once
+    (see ComparisonCurves in PFunc_RCode.R), so each permutation only
+    averages them; the permutations are shared out over the pool in chunks.
+    Returns, for each measure, the observed difference (group A minus group
+    B) and its two-sided permutation p-value.
+    '''
+    members = individuals_a + individuals_b
+    ids = ', '.join(str(individual.id_number) for individual in members)
+    instance_drop, instance_floor = members[0].drop_and_floor()
+    instance_peak = members[0].peak_within()
+    r('''comparison.curves <- ComparisonCurves(master.gam.list[c(%s)],
+                                               master.range.list[c(%s)])
+         comparison.group <- matrix(c(rep(TRUE, %s), rep(FALSE, %s)),
+                                    ncol = 1)
+         observed.differences <- GroupDifferences(comparison.curves$stimulus,
+                                                  comparison.curves$fits,
+                                                  comparison.group,
+                                                  %s, %s, %s)
+      ''' % (ids, ids, len(individuals_a), len(individuals_b), instance_peak,
+             instance_drop, instance_floor))
+    stimulus = list(r('comparison.curves$stimulus'))
+    fits = list(r('as.vector(comparison.curves$fits)'))
+    tasks = []
+    for chunk, start in enumerate(range(0, n_perm, PERMUTATION_CHUNK)):
+        tasks.append({'stimulus': stimulus, 'fits': fits,
+                      'n_a': len(individuals_a),
+                      'n_perm': min(PERMUTATION_CHUNK, n_perm - start),
+                      'seed': bootstrap_seed(seed, 'permutation %d' % chunk),
+                      'peak_within': instance_peak, 'drop': instance_drop,
+                      'tol_floor': instance_floor})
+    chunks = pool.map(permutation_chunk, tasks)
+    results = {}
+    for measure, label in COMPARISON_MEASURES:
+        observed = plain_values(r('observed.differences$%s' % measure))[0]
+        permuted = [value for differences in chunks
+                    for value in differences[measure]
+                    if value is not None and value == value]
+        p_value = None
+        if observed is not None and observed == observed and permuted:
+            threshold = abs(observed) * (1 - 1e-9)
+            extreme = sum(1 for value in permuted if abs(value) >= threshold)
+            p_value = (1 + extreme) / (1 + len(permuted))
+        results[measure] = (observed, p_value)
+    return results
+
+
+def write_comparison(file_name, results):
+    '''Write the results of compare_groups to a csv file.'''
+    with open(file_name, 'w') as outfile:
+        outfile.write('measure,difference,p_value\n')
+        for measure, label in COMPARISON_MEASURES:
+            observed, p_value = results[measure]
+            outfile.write('%s,%s,%s\n' % (measure, csv_value(observed),
+                                           csv_value(p_value)))
+
+
+@traced('export')
+def write_summaries(file_name, individuals, tol_mode, strength_mode):
+    '''Write a csv file with the measures in the Summary box for each
+    individual. If any individual has bootstrap confidence intervals, their
+    bounds are added as extra columns.
+    '''
+    PFuncDataset.from_individuals(individuals).write_summaries(
+        file_name, tol_mode, strength_mode)
+
+
+@traced('export')
+def write_points(file_name, individuals, with_se=False):
+    '''Write a csv file of the points that make up each individual's
+    spline (see PrefFunc.export_points), with their standard errors if
+    with_se is True.
+    '''
+    r("output <- list()")
+    for individual in individuals:
+        stimulus, response, se = individual.export_points()
+        robjects.globalenv['export.stimulus'] = robjects.FloatVector(stimulus)
+        robjects.globalenv['export.response'] = robjects.FloatVector(response)
+        robjects.globalenv['export.se'] = robjects.FloatVector(se)
+        r('''output$%s_stimulus <- export.stimulus
+             output$%s_response <- export.response
+          ''' % (individual.name, individual.name))
+        if with_se:
+            r('output$%s_se <- export.se' % individual.name)
+    r('output <- PadColumns(output)')
+    r('write.csv(output, "%s", row.names = FALSE)' % file_name)
+
+
+@traced('export')
+def write_influence(file_name, individuals):
+    '''Write a csv file of leave-one-out diagnostics for every trial of every
+    individual (see PrefFunc.trial_influence), one trial per row. Group-level
+    splines are skipped.
+    '''
+    with open(file_name, 'w') as outfile:
+        outfile.write('name,' + ','.join(column.replace('.', '_')
+                                         for column in INFLUENCE_COLUMNS)
+                      + '\n')
+        for individual in individuals:
+            if individual.type != 'individual':
+                continue
+            influence = individual.trial_influence()
+            for trial in zip(*[influence[column]
+                               for column in INFLUENCE_COLUMNS]):
+                outfile.write(individual.name + ',' +
+                              ','.join(csv_value(value) for value in trial)
+                              + '\n')
+
+
+@traced('export')
+def write_tolerance_points(file_name, individuals, tol_mode):
+    '''Write a csv file with the start and stop points of each individual's
+    tolerance, one individual per row.
+    '''
+    with open(file_name, 'w') as pointfile:
+        for individual in individuals:
+            if tol_mode == 'broad':
+                tolerance_points = individual.broad_tolerance_points
+            elif tol_mode == 'strict':
+                tolerance_points = individual.strict_tolerance_points
+            pointfile.write(individual.name + ', ' +
+                            ', '.join(csv_value(point)
+                                      for point in tolerance_points) + '\n')
 
 
 class GraphArea(Frame):
@@ -288,8 +1870,11 @@ class GraphArea(Frame):
     '''
     def __init__(self, individual_dict, current_col, current_page,
                  view_names, view_pts, view_pandtol, view_spline, view_se,
-                 tol_mode, input_font, parent=None, **kw):
+                 tol_mode, input_font, name_index=None, parent=None, **kw):
         Frame.__init__(self, parent, relief=SUNKEN, bd=1)
+        self.name_index = name_index
+        self.matches = []  # The id numbers found by find_name
+        self.match = 0
         self.current_col = current_col
         self.recent_col = IntVar()
         self.current_page = current_page
@@ -319,6 +1904,7 @@ class GraphArea(Frame):
         self.cid = ''
         self.current_slot = ''
         self.recent_slot = ''
+        self.mega_slot = ''
         self.num_pages = 0
 
     def create_welcome(self):
@@ -373,6 +1959,7 @@ class GraphArea(Frame):
         self.loading_canvas.update_idletasks()
         self.view = 'loading'
 
+    @traced('render')
     def mini_graphs(self, page, and_deselect=True):
         '''Display 3x3 grid of preference function graphs for a given page.'''
         try:
@@ -396,6 +1983,7 @@ class GraphArea(Frame):
             self.page_total.configure(state=NORMAL)
             self.next_page_butt.configure(state=NORMAL)
             self.last_page_butt.configure(state=NORMAL)
+            self.find_ent.configure(state=NORMAL)
         self.fig = Figure(figsize=(7, 7))
         self.fig.subplots_adjust(top=0.95, right=0.95, bottom=0.12, hspace=0.4,
                                  wspace=0.3)
@@ -430,6 +2018,7 @@ class GraphArea(Frame):
         self.fig.canvas.draw()
         self.parent.config(cursor='')
 
+    @traced('render')
     def mega_graph(self, column):
         '''Draw one big graph for a particular individual.'''
         try:
@@ -457,6 +2046,7 @@ class GraphArea(Frame):
         slot.spines['top'].set_visible(False)
         slot.spines['right'].set_visible(False)
         self.current_page.set(individual.page)
+        self.mega_slot = slot
         self.draw_graph(slot, individual)
         self.fig.text(0.05, 0.45, 'Preference', ha='center', va='bottom',
                       rotation='vertical', fontsize=20)
@@ -498,13 +2088,40 @@ class GraphArea(Frame):
 
     def mega_graph_click(self, event):
         '''When a mega graph is double-clicked, the view returns to the 3x3
-        grid of mini graphs.
+        grid of mini graphs. Right-clicking a data point excludes that trial
+        from the spline, or includes it again.
         '''
         if event.button == 1 and event.dblclick:
             self.mini_graphs(self.current_page.get(), and_deselect=False)
             self.fig.canvas.draw()
             self.page_total.configure(text='/ %s' % self.num_pages)
             self.page_num_ent.configure(textvariable=self.current_page)
+        elif event.button == 3 and self.view_pts.get() == 1:
+            individual = self.individual_dict[self.current_col.get()]
+            row = self.nearest_trial(individual, event)
+            if row is not None:
+                if not individual.toggle_trial(row):
+                    self.event_generate('<<add_message>>', x=108)
+                self.update_graph()
+                self.event_generate('<<update_sp>>')
+                self.event_generate('<<update_summary>>')
+
+    def nearest_trial(self, individual, event):
+        '''Return the row of the individual's trial that was clicked in the
+        mega graph, or None if no trial is within 10 pixels of the click.
+        '''
+        if individual.type != 'individual':
+            return None
+        points = self.mega_slot.transData.transform(
+            list(zip(individual.all_x, individual.all_y)))
+        nearest_row = None
+        nearest_distance = 10 ** 2
+        for row, point in enumerate(points, 1):
+            distance = (point[0] - event.x) ** 2 + (point[1] - event.y) ** 2
+            if distance < nearest_distance:
+                nearest_row = row
+                nearest_distance = distance
+        return nearest_row
 
     def select_mini_graph(self, new_slot, and_deselect=True):
         '''Draws a box around a mini graph and displays its stats when the
@@ -523,6 +2140,30 @@ class GraphArea(Frame):
         self.event_generate('<<update_sp>>')
         self.event_generate('<<update_summary>>')
 
+    def show_individual(self, id_number):
+        '''Bring an individual into view: its big graph in the mega view, or
+        its page with its graph selected in the mini view.
+        '''
+        individual = self.individual_dict[id_number]
+        if self.view == 'mega':
+            self.current_col.set(id_number)
+            self.mega_graph(id_number)
+            self.event_generate('<<update_sp>>')
+            self.event_generate('<<update_summary>>')
+        elif self.view == 'mini' and \
+                individual.page == self.current_page.get():
+            self.select_mini_graph(individual.slot)
+            self.current_slot = individual.slot
+            self.recent_slot = individual.slot
+            self.recent_col.set(id_number)
+            self.fig.canvas.draw()
+        elif self.view == 'mini':
+            self.current_page.set(individual.page)
+            self.current_slot = individual.slot
+            self.recent_slot = individual.slot
+            self.recent_col.set(id_number)
+            self.mini_graphs(individual.page, and_deselect=False)
+
     def deselect_mini_graph(self):
         '''Removes the box around the graph and clears the stat display when
         a mini graph is deselected.
@@ -578,6 +2219,7 @@ class GraphArea(Frame):
         slot.tick_params(labelsize=20, top=False, right=False, pad=8)
         slot.spines['top'].set_visible(False)
         slot.spines['right'].set_visible(False)
+        self.mega_slot = slot
         self.draw_graph(slot, individual)
         self.fig.text(0.05, 0.45, 'Preference', ha='center', va='bottom',
                       rotation='vertical', fontsize=20)
@@ -596,6 +2238,11 @@ class GraphArea(Frame):
         if self.view_pts.get() == 1 and individual.type == 'individual':
             slot.plot(individual.data_x, individual.data_y, 'k.',
                       markersize=pt_size)
+            if len(individual.excluded) > 0:
+                excluded_x, excluded_y = individual.excluded_points()
+                slot.plot(excluded_x, excluded_y, color='#999999',
+                          marker='o', linestyle='none', fillstyle='none',
+                          markersize=(pt_size / 2))
         elif self.view_pts.get() == 1 and individual.type == 'group':
             n_constit = int(r("""
                               tempdf <- %s
@@ -630,17 +2277,18 @@ class GraphArea(Frame):
             #                individual.tolerance_points[t+1]],
             #               [individual.tolerance_height,
             #                individual.tolerance_height], 'b-')
+        spline_x, spline_y, spline_se = individual.spline_points(self.view)
         if self.view_spline.get() == 1:
-            slot.plot(individual.spline_x, individual.spline_y, 'k-')
+            slot.plot(spline_x, spline_y, 'k-')
         if self.view_se.get() == 1:
             upper_se = []
             lower_se = []
-            for i in range(len(individual.se)):
-                upper_se.append(individual.spline_y[i] + individual.se[i])
-                lower_se.append(individual.spline_y[i] - individual.se[i])
-            slot.plot(individual.spline_x, upper_se, color='#666666',
+            for i in range(len(spline_se)):
+                upper_se.append(spline_y[i] + spline_se[i])
+                lower_se.append(spline_y[i] - spline_se[i])
+            slot.plot(spline_x, upper_se, color='#666666',
                       linestyle='dashed')
-            slot.plot(individual.spline_x, lower_se, color='#666666',
+            slot.plot(spline_x, lower_se, color='#666666',
                       linestyle='dashed')
         if self.view_names.get() == 1 and self.view == 'mini':
             slot.set_title(individual.name, size='small')
@@ -694,6 +2342,33 @@ class GraphArea(Frame):
                                      padx=pd[0], pady=pd[2], state=DISABLED,
                                      command=self.last_page)
         self.last_page_butt.grid(row=0, column=6)
+        self.find_label = Label(self.page_controls, text='Find')
+        self.find_label.grid(row=0, column=8)
+        self.find_text = StringVar()
+        self.find_ent = Entry(self.page_controls, width=12,
+                              textvariable=self.find_text,
+                              font=self.input_font, state=DISABLED)
+        self.find_ent.grid(row=0, column=9)
+        self.find_ent.bind('<Return>', self.next_match)
+        self.find_text.trace_add('write', self.find_name)
+
+    def find_name(self, *args):
+        '''Show the first individual whose name matches what has been typed
+        into Find so far (see NameIndex.search).
+        '''
+        query = self.find_text.get()
+        self.matches = []
+        if query != '' and self.name_index is not None:
+            self.matches = self.name_index.search(query)
+        self.match = 0
+        if len(self.matches) > 0:
+            self.show_individual(self.matches[0])
+
+    def next_match(self, event=None):
+        '''Show the next individual that matches Find.'''
+        if len(self.matches) > 0:
+            self.match = (self.match + 1) % len(self.matches)
+            self.show_individual(self.matches[self.match])
 
     def first_page(self):
         '''Jump to the first page'''
@@ -1231,6 +2906,7 @@ class FileMenu(Menubutton):
         self.grid(row=row, column=column, sticky=W)
         self.file_opt = file_opt
         self.parent = parent
+        self.is_vertical = 0
         self.primary_menu = Menu(self, tearoff=0)
         self.open_menu = Menu(self, tearoff=0)
         self.open_menu.add_command(label='Horizontal...',
@@ -1239,6 +2915,9 @@ class FileMenu(Menubutton):
                                    command=self.open_vertical_file)
         self.primary_menu.add_cascade(label='Open Data File',
                                       menu=self.open_menu)
+        self.primary_menu.add_command(label='Append Data File...',
+                                      command=self.append_data_file,
+                                      state=DISABLED)
         self.primary_menu.add_separator()
         self.primary_menu.add_command(label='Load Smoothing Values...',
                                       command=self.open_sp,
@@ -1269,20 +2948,26 @@ class FileMenu(Menubutton):
         self.primary_menu.add_command(label='Output Tolerance Points...',
                                       command=self.output_tol,
                                       state=DISABLED)
+        self.primary_menu.add_command(label='Output Trial Influence...',
+                                      command=self.output_influence,
+                                      state=DISABLED)
         self.primary_menu.add_separator()
         self.primary_menu.add_command(label='Quit', command=self.quit)
 
         self['menu'] = self.primary_menu
 
     def activate_menu_options(self):
-        self.primary_menu.entryconfigure(2, state=NORMAL)
+        self.primary_menu.entryconfigure(1, state=NORMAL)
         self.primary_menu.entryconfigure(3, state=NORMAL)
         self.primary_menu.entryconfigure(4, state=NORMAL)
-        self.primary_menu.entryconfigure(10, state=NORMAL)
+        self.primary_menu.entryconfigure(5, state=NORMAL)
         self.primary_menu.entryconfigure(11, state=NORMAL)
         self.primary_menu.entryconfigure(12, state=NORMAL)
         self.primary_menu.entryconfigure(13, state=NORMAL)
+        self.primary_menu.entryconfigure(14, state=NORMAL)
+        self.primary_menu.entryconfigure(15, state=NORMAL)
 
+    @traced('validate')
     def _check_missing_stim(self, is_vertical=0):
         '''Used when opening a new file. Checks whether any x-axis values
         are missing.
@@ -1304,6 +2989,7 @@ class FileMenu(Menubutton):
         else:
             return True
 
+    @traced('validate')
     def _check_num_datapoints(self, is_vertical):
         '''Used when opening a new file. Checks whether there are enough data
         points.
@@ -1345,6 +3031,7 @@ class FileMenu(Menubutton):
             return False
         return True
 
+    @traced('parse')
     def check_data_formatting(self, datafile=None):
         '''Used when opening a new data file. Checks whether file is .csv'''
         if datafile is None:
@@ -1378,21 +3065,8 @@ class FileMenu(Menubutton):
             is_vertical = 0
             if (self._check_missing_stim(is_vertical) &
                     self._check_num_datapoints(is_vertical)):
-                r("""
-                    max.resp <- max(mydata[ , 2:ncol(mydata)], na.rm = TRUE)
-                    min.resp <- min(mydata[ , 2:ncol(mydata)], na.rm = TRUE)
-                    resp.range <- max.resp - min.resp
-                    max.y <- max.resp + (0.0375 * resp.range * 2)
-                    min.y <- min.resp - (0.0375 * resp.range * 1)
-
-                    max.stim <- max(mydata[ , 1], na.rm = TRUE)
-                    min.stim <- min(mydata[ , 1], na.rm = TRUE)
-                    stim.range <- max.stim - min.stim
-                    max.x <- max.stim + (0.0375 * stim.range * 1)
-                    min.x <- min.stim - (0.0375 * stim.range * 1)
-
-                    range.bundle <- c(min.x, max.x, min.y, max.y)
-                    """)
+                self._set_ranges(is_vertical)
+                self.is_vertical = is_vertical
                 self.event_generate('<<open_data_file>>', x=is_vertical)
 
     def open_vertical_file(self):
@@ -1423,6 +3097,32 @@ class FileMenu(Menubutton):
         is_vertical = 1
         if (self._check_missing_stim(is_vertical) &
                 self._check_num_datapoints(is_vertical)):
+            self._set_ranges(is_vertical)
+            self.is_vertical = is_vertical
+            self.event_generate('<<open_data_file>>', x=is_vertical)
+
+    def _set_ranges(self, is_vertical):
+        '''Used when opening or appending to a data file. Sets the axis
+        ranges shared by all the graphs.
+        '''
+        r = robjects.r
+        if not is_vertical:
+            r("""
+                max.resp <- max(mydata[ , 2:ncol(mydata)], na.rm = TRUE)
+                min.resp <- min(mydata[ , 2:ncol(mydata)], na.rm = TRUE)
+                resp.range <- max.resp - min.resp
+                max.y <- max.resp + (0.0375 * resp.range * 2)
+                min.y <- min.resp - (0.0375 * resp.range * 1)
+
+                max.stim <- max(mydata[ , 1], na.rm = TRUE)
+                min.stim <- min(mydata[ , 1], na.rm = TRUE)
+                stim.range <- max.stim - min.stim
+                max.x <- max.stim + (0.0375 * stim.range * 1)
+                min.x <- min.stim - (0.0375 * stim.range * 1)
+
+                range.bundle <- c(min.x, max.x, min.y, max.y)
+                """)
+        else:
             r("""
                 max.resp <- max(mydata[, resp.column])
                 min.resp <- min(mydata[, resp.column])
@@ -1438,7 +3138,54 @@ class FileMenu(Menubutton):
 
                 range.bundle <- c(min.x, max.x, min.y, max.y)
                 """)
-            self.event_generate('<<open_data_file>>', x=is_vertical)
+
+    def append_data_file(self):
+        '''Add the rows of another data file, laid out like the open one, to
+        the open data. Only the individuals that gain trials are refit (see
+        MainApp.append_data_file).
+        '''
+        datafile = filedialog.askopenfile(mode='r', **self.file_opt)
+        if datafile is None:
+            return
+        r = robjects.r
+        robjects.globalenv['new.file.name'] = robjects.StrVector(
+            [datafile.name])
+        datafile.close()
+        new_columns = r("""new.data <- ReadDataFile(new.file.name)
+                           names(new.data)""")
+        if self.is_vertical:
+            needed = [self.id_column.get(), self.stim_column.get(),
+                      self.resp_column.get()]
+        else:
+            needed = []
+        if len(new_columns) == 1 or not set(needed) <= set(new_columns):
+            error_text = ("The data file you selected is not formatted "
+                          "like the open one.\n\nMake sure it is saved as a "
+                          ".csv file with the same columns.")
+            messagebox.showerror('Error', error_text)
+            self.event_generate('<<add_message>>', x=104)
+            return
+        r("""previous.data <- mydata
+             previous.names <- name.vect""")
+        if not self.is_vertical:
+            r("""gained.names <- GainedIndividuals(new.data)
+                 mydata <- AppendRows(mydata, new.data, horizontal = TRUE)
+                 name.vect <- names(mydata)[2:ncol(mydata)]
+              """)
+        else:
+            r("""gained.names <- GainedIndividuals(new.data,
+                                                   names(mydata)[id.column],
+                                                   names(mydata)[resp.column])
+                 mydata <- AppendRows(mydata, new.data)
+                 name.vect <- unique(as.character(mydata[, id.column]))
+              """)
+        if (self._check_missing_stim(self.is_vertical) &
+                self._check_num_datapoints(self.is_vertical)):
+            self._set_ranges(self.is_vertical)
+            self.event_generate('<<append_data_file>>')
+        else:
+            r("""mydata <- previous.data
+                 name.vect <- previous.names""")
 
     def open_sp(self):
         self.event_generate('<<open_smoothing_file>>')
@@ -1470,6 +3217,9 @@ class FileMenu(Menubutton):
     def output_tol(self):
         self.event_generate('<<output_tol>>')
 
+    def output_influence(self):
+        self.event_generate('<<output_influence>>')
+
     def quit(self):
         self.event_generate('<<quit>>')
 
@@ -1478,26 +3228,85 @@ class AdvancedMenu(Menubutton):
     '''Defines the Advanced menu at the top of the screen (and accompanying
     functions).
     '''
-    def __init__(self, parent=None, row=0, column=0):
+    def __init__(self, spline_engine, bootstrap_reps, record_timings,
+                 record_memory, parent=None, row=0, column=0):
         Menubutton.__init__(self, parent, text='Advanced')
         self.grid(row=row, column=column, sticky=W)
         self.primary_menu = Menu(self, tearoff=0)
         self.primary_menu.add_command(label='Show Message Log',
                                       command=self.message_log)
+        self.primary_menu.add_command(label='Show Results Table',
+                                      command=self.results_table,
+                                      state=DISABLED)
         self.primary_menu.add_command(label='Construct Group-Level Spline...',
                                       command=self.construct_group_spline,
                                       state=DISABLED)
+        self.primary_menu.add_command(label='Compare Groups...',
+                                      command=self.compare_groups,
+                                      state=DISABLED)
+        self.engine_menu = Menu(self.primary_menu, tearoff=0)
+        self.engine_menu.add_radiobutton(label='Thin Plate (mgcv)',
+                                         variable=spline_engine, value='tprs',
+                                         command=self.change_engine)
+        self.engine_menu.add_radiobutton(label='P-Spline (long series)',
+                                         variable=spline_engine,
+                                         value='pspline',
+                                         command=self.change_engine)
+        self.primary_menu.add_cascade(label='Spline Engine',
+                                      menu=self.engine_menu)
+        self.interval_menu = Menu(self.primary_menu, tearoff=0)
+        for reps, label in ((0, 'None'), (1000, '1,000 Replicates'),
+                            (2000, '2,000 Replicates'),
+                            (10000, '10,000 Replicates')):
+            self.interval_menu.add_radiobutton(label=label,
+                                               variable=bootstrap_reps,
+                                               value=reps)
+        self.primary_menu.add_cascade(label='Confidence Intervals',
+                                      menu=self.interval_menu)
+        self.primary_menu.add_checkbutton(label='Record Timings',
+                                          variable=record_timings,
+                                          command=self.toggle_timings)
+        self.primary_menu.add_command(label='Save Timing Trace...',
+                                      command=self.save_trace)
+        self.primary_menu.add_checkbutton(label='Record Memory Use',
+                                          variable=record_memory,
+                                          command=self.toggle_memory)
+        self.primary_menu.add_command(label='Save Memory Report...',
+                                      command=self.save_memory_report)
         self['menu'] = self.primary_menu
 
     def activate_menu_options(self):
         self.primary_menu.entryconfigure(1, state=NORMAL)
+        self.primary_menu.entryconfigure(2, state=NORMAL)
+        self.primary_menu.entryconfigure(3, state=NORMAL)
 
     def message_log(self):
         self.event_generate('<<open_message_log>>')
 
+    def results_table(self):
+        self.event_generate('<<open_results_table>>')
+
     def construct_group_spline(self):
         self.event_generate('<<open_group_spline_window>>')
 
+    def compare_groups(self):
+        self.event_generate('<<open_group_comparison_window>>')
+
+    def change_engine(self):
+        self.event_generate('<<change_engine>>')
+
+    def toggle_timings(self):
+        self.event_generate('<<toggle_timings>>')
+
+    def save_trace(self):
+        self.event_generate('<<save_trace>>')
+
+    def toggle_memory(self):
+        self.event_generate('<<toggle_memory>>')
+
+    def save_memory_report(self):
+        self.event_generate('<<save_memory_report>>')
+
 
 class HelpMenu(Menubutton):
     '''Defines the Help menu at the top of the screen (and accompanying
@@ -1532,13 +3341,17 @@ class HelpMenu(Menubutton):
 
 class MenuBar(Frame):
     '''Defines the entire menu bar at the top of the screen.'''
-    def __init__(self, file_opt, parent=None, row=0, column=0):
+    def __init__(self, file_opt, spline_engine, bootstrap_reps,
+                 record_timings, record_memory, parent=None, row=0,
+                 column=0):
         Frame.__init__(self, parent)
         self.parent = parent
         self.grid(row=row, column=column, sticky=EW, columnspan=2)
         self.columnconfigure(3, weight=1)
         self.file_menu = FileMenu(parent=self, file_opt=file_opt)
-        self.advc_menu = AdvancedMenu(self, column=1)
+        self.advc_menu = AdvancedMenu(spline_engine, bootstrap_reps,
+                                      record_timings, record_memory, self,
+                                      column=1)
         self.help_menu = HelpMenu(self, column=2)
 
     def activate(self):
@@ -1626,12 +3439,16 @@ class GroupSplineWindow(PFuncToplevel):
     '''Used for combining multiple splines into one group-level spline. Users
     tell PFunc which individuals should be part of the group.
     '''
-    def __init__(self, parent, individual_dict, combomode, input_font, **kw):
+    def __init__(self, parent, individual_dict, name_index, combomode,
+                 input_font, **kw):
         self.parent = parent
         PFuncToplevel.__init__(self, self.parent)
         self.transient(self.parent)
         self.individual_dict = individual_dict
+        self.name_index = name_index
         self.combomode = combomode
+        self.chosen = set()  # The id numbers selected, shown or not
+        self.shown = []  # The id numbers in the list, in order
         self.columnconfigure(0, weight=1)
         self.rowconfigure(2, weight=1)
         rootWd = int(parent.winfo_width()) / 2
@@ -1648,7 +3465,8 @@ class GroupSplineWindow(PFuncToplevel):
                              "Click and drag to select multiple\n"
                              "individuals at once. Hold down\n"
                              "ctrl to add or subtract individuals\n"
-                             "from your selection.")
+                             "from your selection. Type in Filter\n"
+                             "to list only the matching names.")
         self.instruction_box = Label(self, text=self.instructions,
                                      justify=LEFT, padx=5, pady=5)
         self.instruction_box.grid(row=0, column=0, sticky=W)
@@ -1662,27 +3480,28 @@ class GroupSplineWindow(PFuncToplevel):
         self.newname_ent = Entry(self.namebox, textvariable=self.newname,
                                  width=15, font=input_font)
         self.newname_ent.grid(row=1, column=1, sticky=W)
+        self.filter_lab = Label(self.namebox, text='Filter')
+        self.filter_lab.grid(row=2, column=0, sticky=EW)
+        self.filter_text = StringVar()
+        self.filter_ent = Entry(self.namebox, textvariable=self.filter_text,
+                                width=15, font=input_font)
+        self.filter_ent.grid(row=2, column=1, sticky=W)
+        self.filter_text.trace_add('write', self.filter_names)
 
         self.listframe = Frame(self, padx=20)
         self.listframe.grid(row=2, column=0, sticky=NSEW)
         self.listframe.columnconfigure(0, weight=1)
         self.listframe.rowconfigure(0, weight=1)
 
-        self.namestring = ''
-        for i in self.individual_dict:
-            self.namestring = (self.namestring +
-                               self.individual_dict[i].name + ' ')
-        self.namestring = self.namestring[:-1]
-        self.names = StringVar()
-        self.names.set(self.namestring)
         self.listscroll = Scrollbar(self.listframe, orient=VERTICAL)
         self.listscroll.grid(row=0, column=1, sticky=NS+W)
-        self.listbox = Listbox(self.listframe, listvariable=self.names,
-                               height=15, selectmode=EXTENDED,
+        self.listbox = Listbox(self.listframe, height=15, selectmode=EXTENDED,
                                yscrollcommand=self.listscroll.set,
                                font=input_font)
         self.listbox.grid(row=0, column=0, sticky=NSEW)
+        self.listbox.bind('<<ListboxSelect>>', self.choose)
         self.listscroll['command'] = self.listbox.yview
+        self.filter_names()
 
         self.okayframe = Frame(self, padx=20, pady=5)
         self.okayframe.grid(row=3, column=0)
@@ -1693,6 +3512,32 @@ class GroupSplineWindow(PFuncToplevel):
         self.cancel_butt.grid(row=0, column=1, sticky=W)
         self.event_generate('<<open_message_log>>')
 
+    def filter_names(self, *args):
+        '''List the individuals whose names match the filter (see
+        NameIndex.search), or all of them, keeping earlier selections.
+        '''
+        query = self.filter_text.get()
+        if query == '':
+            self.shown = list(self.individual_dict.keys())
+        else:
+            self.shown = self.name_index.search(query)
+        self.listbox.delete(0, END)
+        if len(self.shown) > 0:
+            self.listbox.insert(END, *[self.individual_dict[i].name
+                                       for i in self.shown])
+        for n, i in enumerate(self.shown):
+            if i in self.chosen:
+                self.listbox.selection_set(n)
+
+    def choose(self, event=None):
+        '''Keep track of the selection of the individuals in the list.'''
+        selected = set(self.listbox.curselection())
+        for n, i in enumerate(self.shown):
+            if n in selected:
+                self.chosen.add(i)
+            else:
+                self.chosen.discard(i)
+
     def cleanup_name(self):
         name = self.newname.get()
         new_name = ""
@@ -1714,8 +3559,7 @@ class GroupSplineWindow(PFuncToplevel):
         self.cleanup_name()
         self.output_dict = {'name': self.newname.get(), 'individual_nums': [],
                             'method': self.combomode.get(), }
-        for i in self.listbox.curselection():
-            self.output_dict['individual_nums'].append(i+1)
+        self.output_dict['individual_nums'] = sorted(self.chosen)
         numsExist = len(self.output_dict['individual_nums']) > 0
         namesExist = len(self.output_dict['name']) > 0
         if numsExist and namesExist:
@@ -1724,8 +3568,8 @@ class GroupSplineWindow(PFuncToplevel):
 
     def combine_spline(self):
         r('mylist <- list()')
-        for i in self.listbox.curselection():
-            tempind = self.individual_dict[i + 1]
+        for i in sorted(self.chosen):
+            tempind = self.individual_dict[i]
             tempx = str(tempind.spline_x.r_repr())
             tempy = str(tempind.spline_y.r_repr())
             r("""mylist$%s <- list('xvals' = %s,
@@ -1783,6 +3627,338 @@ class GroupSplineWindow(PFuncToplevel):
         self.parent.event_generate('<<add_group_spline>>')
 
 
+class GroupComparisonWindow(PFuncToplevel):
+    '''Used for testing whether two groups of individuals differ. Users pick
+    the members of each group, and PFunc compares the groups' mean curves
+    with a permutation test.
+    '''
+    def __init__(self, parent, individual_dict, compare, input_font, **kw):
+        self.parent = parent
+        PFuncToplevel.__init__(self, self.parent)
+        self.transient(self.parent)
+        self.title('Compare Groups')
+        self.individual_dict = individual_dict
+        self.compare = compare
+        self.results = None
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(2, weight=1)
+        self.instructions = ("Select the individuals in each group. Each "
+                             "individual can only be in one group.\n"
+                             "Differences are group A minus group B.")
+        self.instruction_box = Label(self, text=self.instructions,
+                                     justify=LEFT, padx=5, pady=5)
+        self.instruction_box.grid(row=0, column=0, columnspan=2, sticky=W)
+
+        self.names = StringVar()
+        self.names.set(' '.join(self.individual_dict[i].name
+                                for i in self.individual_dict))
+        self.listboxes = []
+        for column, label in enumerate(('Group A', 'Group B')):
+            Label(self, text=label).grid(row=1, column=column)
+            listframe = Frame(self, padx=10)
+            listframe.grid(row=2, column=column, sticky=NSEW)
+            listframe.columnconfigure(0, weight=1)
+            listframe.rowconfigure(0, weight=1)
+            listscroll = Scrollbar(listframe, orient=VERTICAL)
+            listscroll.grid(row=0, column=1, sticky=NS+W)
+            listbox = Listbox(listframe, listvariable=self.names, height=15,
+                              selectmode=EXTENDED, exportselection=False,
+                              yscrollcommand=listscroll.set, font=input_font)
+            listbox.grid(row=0, column=0, sticky=NSEW)
+            listscroll['command'] = listbox.yview
+            self.listboxes.append(listbox)
+
+        self.n_perm = StringVar()
+        self.n_perm.set('10000')
+        self.permframe = Frame(self, pady=5)
+        self.permframe.grid(row=3, column=0, columnspan=2)
+        Label(self.permframe, text='Permutations').grid(row=0, column=0)
+        self.n_perm_ent = Entry(self.permframe, textvariable=self.n_perm,
+                                width=8, font=input_font)
+        self.n_perm_ent.grid(row=0, column=1)
+
+        self.result_text = StringVar()
+        self.result_box = Label(self, textvariable=self.result_text,
+                                justify=LEFT, font=input_font, padx=5)
+        self.result_box.grid(row=4, column=0, columnspan=2, sticky=W)
+
+        self.okayframe = Frame(self, padx=20, pady=5)
+        self.okayframe.grid(row=5, column=0, columnspan=2)
+        self.compare_butt = Button(self.okayframe, text='Compare',
+                                   command=self.run_comparison)
+        self.compare_butt.grid(row=0, column=0)
+        self.save_butt = Button(self.okayframe, text='Save Results...',
+                                command=self.save_results, state=DISABLED)
+        self.save_butt.grid(row=0, column=1)
+        self.close_butt = Button(self.okayframe, text='Close',
+                                 command=self.destroy)
+        self.close_butt.grid(row=0, column=2)
+
+    def run_comparison(self):
+        ids_a = [i + 1 for i in self.listboxes[0].curselection()]
+        ids_b = [i + 1 for i in self.listboxes[1].curselection()]
+        if len(ids_a) == 0 or len(ids_b) == 0:
+            messagebox.showerror('Error', 'Select at least one individual '
+                                          'for each group.', parent=self)
+            return
+        if set(ids_a) & set(ids_b):
+            messagebox.showerror('Error', 'An individual cannot be in both '
+                                          'groups.', parent=self)
+            return
+        try:
+            n_perm = int(self.n_perm.get())
+        except ValueError:
+            n_perm = 0
+        if n_perm < 1:
+            messagebox.showerror('Error', 'The number of permutations must '
+                                          'be a positive whole number.',
+                                 parent=self)
+            return
+        self.results = self.compare(ids_a, ids_b, n_perm)
+        lines = ['%-20s %12s %10s' % ('', 'Difference', 'p')]
+        for measure, label in COMPARISON_MEASURES:
+            observed, p_value = self.results[measure]
+            lines.append('%-20s %12s %10s' % (label, csv_value(observed),
+                                              csv_value(p_value)))
+        self.result_text.set('\n'.join(lines))
+        self.save_butt.configure(state=NORMAL)
+
+    def save_results(self):
+        resultfile = filedialog.asksaveasfile(
+            mode='w', initialfile='group_comparison.csv',
+            defaultextension='.csv',
+            filetypes=[('all files', '.*'), ('csv files', '.csv')],
+            parent=self, title='Save comparison...')
+        if resultfile is not None:
+            resultfile.close()
+            write_comparison(resultfile.name, self.results)
+
+
+class ResultsTable(PFuncToplevel):
+    '''A table of every individual's measures. Clicking a heading sorts by
+    that column (again to reverse), the sorted column can be filtered to a
+    range, and clicking a row shows that individual in the graph area. Only
+    the rows in view are drawn, and sorting uses the orders cached by
+    PFuncDataset, so the table stays quick for large cohorts.
+    '''
+    def __init__(self, parent, dataset, tol_mode, show_individual,
+                 input_font, **kw):
+        self.parent = parent
+        PFuncToplevel.__init__(self, self.parent)
+        self.title('Results Table')
+        self.dataset = dataset
+        self.tol_mode = tol_mode
+        self.show_individual = show_individual
+        self.font = input_font
+        self.row_height = input_font.metrics('linespace') + 4
+        self.widths = [input_font.measure('0') * chars + 8
+                       for measure, label, chars in RESULTS_COLUMNS]
+        self.sort_measure = None  # None keeps the order of the data file
+        self.descending = False
+        self.rows = np.arange(0)
+        self.top = 0  # The first row in view
+        self.selected = None  # The id number of the clicked row
+        self.arranged = None  # The dataset version and tol_mode shown
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        table_width = sum(self.widths)
+        self.header = Canvas(self, width=table_width, height=self.row_height,
+                             bg='#e8e8e8', highlightthickness=0)
+        self.header.grid(row=0, column=0, sticky=EW)
+        self.header.bind('<Button-1>', self.sort_click)
+        self.body = Canvas(self, width=table_width,
+                           height=20 * self.row_height, bg='white',
+                           highlightthickness=0)
+        self.body.grid(row=1, column=0, sticky=NSEW)
+        self.body.bind('<Configure>', self.draw)
+        self.body.bind('<Button-1>', self.row_click)
+        self.body.bind('<MouseWheel>', self.wheel)
+        self.body.bind('<Button-4>', self.wheel)
+        self.body.bind('<Button-5>', self.wheel)
+        self.scrollbar = Scrollbar(self, orient=VERTICAL, command=self.scroll)
+        self.scrollbar.grid(row=1, column=1, sticky=NS)
+
+        self.low = StringVar()
+        self.high = StringVar()
+        self.filterframe = Frame(self, pady=5)
+        self.filterframe.grid(row=2, column=0, columnspan=2)
+        Label(self.filterframe, text='Sorted column from').grid(row=0,
+                                                                column=0)
+        Entry(self.filterframe, textvariable=self.low, width=8,
+              font=input_font).grid(row=0, column=1)
+        Label(self.filterframe, text='to').grid(row=0, column=2)
+        Entry(self.filterframe, textvariable=self.high, width=8,
+              font=input_font).grid(row=0, column=3)
+        Button(self.filterframe, text='Filter',
+               command=self.refresh).grid(row=0, column=4)
+        Button(self.filterframe, text='Clear',
+               command=self.clear_filter).grid(row=0, column=5)
+
+        self.count_text = StringVar()
+        self.okayframe = Frame(self, padx=5, pady=5)
+        self.okayframe.grid(row=3, column=0, columnspan=2, sticky=EW)
+        self.okayframe.columnconfigure(0, weight=1)
+        Label(self.okayframe, textvariable=self.count_text).grid(row=0,
+                                                                 column=0,
+                                                                 sticky=W)
+        self.close_butt = Button(self.okayframe, text='Close',
+                                 command=self.destroy)
+        self.close_butt.grid(row=0, column=1)
+        self.refresh()
+        self.poll_id = self.after(500, self.poll)
+
+    def destroy(self):
+        self.after_cancel(self.poll_id)
+        PFuncToplevel.destroy(self)
+
+    def poll(self):
+        '''Rearrange the table when the measures or tol_mode change.'''
+        if self.arranged != (self.dataset.version, self.tol_mode.get()):
+            self.refresh()
+        self.poll_id = self.after(500, self.poll)
+
+    def measure_name(self, measure):
+        if measure == 'tolerance':
+            return '%s_tolerance' % self.tol_mode.get()
+        return measure
+
+    def filter_range(self):
+        '''Return the low and high ends of the filter, infinite if blank or
+        not a number.
+        '''
+        ends = []
+        for entry, default in ((self.low, -np.inf), (self.high, np.inf)):
+            try:
+                ends.append(float(entry.get()))
+            except ValueError:
+                ends.append(default)
+        return ends
+
+    def clear_filter(self):
+        self.low.set('')
+        self.high.set('')
+        self.refresh()
+
+    def refresh(self):
+        self.arrange()
+        self.draw_header()
+        self.draw()
+
+    def arrange(self):
+        '''Sort and filter the rows.'''
+        size = self.dataset.size
+        measure = self.sort_measure
+        if measure is None:
+            rows = np.arange(size)
+        elif measure in ('name', 'status'):
+            rows = self.dataset.order(measure)
+            if self.descending:
+                rows = rows[::-1]
+        else:
+            measure = self.measure_name(measure)
+            low, high = self.filter_range()
+            rows = self.dataset.rows_between(measure, low, high)
+            if self.descending:
+                valid = np.count_nonzero(
+                    ~np.isnan(self.dataset.column(measure)[rows]))
+                rows = np.concatenate([rows[:valid][::-1], rows[valid:]])
+        self.rows = rows
+        self.arranged = (self.dataset.version, self.tol_mode.get())
+        self.count_text.set('%d of %d individuals' % (len(rows), size))
+
+    def visible_rows(self):
+        return max(1, self.body.winfo_height() // self.row_height)
+
+    def draw_header(self):
+        self.header.delete('all')
+        x = 0
+        for (measure, label, chars), width in zip(RESULTS_COLUMNS,
+                                                  self.widths):
+            if measure == self.sort_measure:
+                label += (' \u25bc' if self.descending else ' \u25b2')
+            self.header.create_text(x + 4, self.row_height // 2, anchor=W,
+                                    text=label, font=self.font)
+            x += width
+
+    def draw(self, event=None):
+        '''Draw the rows in view.'''
+        self.body.delete('all')
+        visible = self.visible_rows()
+        self.top = max(0, min(self.top, len(self.rows) - visible))
+        columns = [self.dataset.values(self.measure_name(measure))
+                   for measure, label, chars in RESULTS_COLUMNS]
+        table_width = sum(self.widths)
+        for n, row in enumerate(self.rows[self.top:self.top + visible]):
+            y = n * self.row_height
+            if row + 1 == self.selected:
+                self.body.create_rectangle(0, y, table_width,
+                                           y + self.row_height,
+                                           fill='#cce0ff', outline='')
+            x = 0
+            for values, width in zip(columns, self.widths):
+                self.body.create_text(x + 4, y + self.row_height // 2,
+                                      anchor=W, text=table_cell(values[row]),
+                                      font=self.font)
+                x += width
+        if len(self.rows) == 0:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.top / len(self.rows),
+                               (self.top + visible) / len(self.rows))
+
+    def scroll(self, *args):
+        '''The Scrollbar's command: ('moveto', fraction) or
+        ('scroll', steps, 'units' or 'pages').
+        '''
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.rows))
+        elif args[0] == 'scroll':
+            steps = int(args[1])
+            if args[2] == 'pages':
+                steps *= self.visible_rows()
+            self.top += steps
+        self.draw()
+
+    def wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll('scroll', -3, 'units')
+        else:
+            self.scroll('scroll', 3, 'units')
+
+    def sort_click(self, event):
+        x = 0
+        for (measure, label, chars), width in zip(RESULTS_COLUMNS,
+                                                  self.widths):
+            x += width
+            if event.x < x:
+                if measure == self.sort_measure:
+                    self.descending = not self.descending
+                else:
+                    self.sort_measure = measure
+                    self.descending = False
+                self.top = 0
+                self.refresh()
+                return
+
+    def row_click(self, event):
+        n = self.top + int(event.y // self.row_height)
+        if n < len(self.rows):
+            self.selected = int(self.rows[n]) + 1
+            self.draw()
+            self.show_individual(self.selected)
+
+
+def table_cell(value):
+    '''Format one value of the results table.'''
+    if isinstance(value, str):
+        return RESULTS_STATUSES.get(value, value)
+    if value is None or np.isnan(value):
+        return 'NA'
+    return '%.4g' % value
+
+
 class PFuncMessages(PFuncToplevel):
     '''Defines the popup window of messages that users can access from the
     Advanced menu.
@@ -1795,7 +3971,11 @@ class PFuncMessages(PFuncToplevel):
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
         self.logArea = Text(self, height=8, width=32, wrap=WORD)
-        self.logArea.insert(END, self.messages.get())
+        lines = self.messages.lines()
+        # Lines in each record shown, oldest first, so whole records can be
+        # dropped from the top
+        self.record_lines = deque(line.count('\n') + 1 for line in lines)
+        self.logArea.insert(END, '\n'.join(lines))
         self.logArea.grid(row=0, column=0, sticky=NSEW)
         self.logArea.tag_add('message_tag', '@0,0', END)
         self.logArea.tag_config('message_tag', lmargin2='32p')
@@ -1806,6 +3986,11 @@ class PFuncMessages(PFuncToplevel):
         self.logArea['yscrollcommand'] = self.logScroll.set
         self.logArea.configure(state=DISABLED)
         self._establish_placement()
+        self.messages.subscribe(self.add_record)
+
+    def destroy(self):
+        self.messages.unsubscribe(self.add_record)
+        PFuncToplevel.destroy(self)
 
     def _establish_placement(self):
         screenWd = int(self.parent.winfo_screenwidth())
@@ -1828,11 +4013,19 @@ class PFuncMessages(PFuncToplevel):
         yPos = int(self.parent.winfo_geometry().split('+')[2]) + rootHt - reqHt
         self.geometry('+%d+%d' % (xPos, yPos))
 
-    def add_message(self, message_string):
+    def add_record(self, record):
+        '''Add a new message to the end, dropping the oldest messages once
+        there are more than the log keeps (see MessageLog).
+        '''
         self.logArea.configure(state=NORMAL)
-        self.logArea.insert(END, message_string)
-        self.logArea.tag_add('message_tag', '@0,0', END)
-        self.logArea.tag_config('message_tag', lmargin2='32p')
+        if self.logArea.compare('end-1c', '!=', '1.0'):
+            self.logArea.insert(END, '\n')
+        line = format_record(record)
+        self.logArea.insert(END, line, 'message_tag')
+        self.record_lines.append(line.count('\n') + 1)
+        while len(self.record_lines) > self.messages.size:
+            oldest = self.record_lines.popleft()
+            self.logArea.delete('1.0', '%d.0' % (oldest + 1))
         self.logArea.see(END)
         self.logArea.configure(state=DISABLED)
 
@@ -1926,13 +4119,19 @@ class MainApp():
         self._setup_event_bindings()
         self._setup_window_geometry()
         self.settings_to_default()
-        self.menu_bar = MenuBar(file_opt=self.file_opt, parent=self.root)
+        self.menu_bar = MenuBar(file_opt=self.file_opt,
+                                spline_engine=self.spline_engine,
+                                bootstrap_reps=self.bootstrap_reps,
+                                record_timings=self.record_timings,
+                                record_memory=self.record_memory,
+                                parent=self.root)
         self.graph_zone = GraphArea(self.individual_dict, self.current_col,
                                     self.current_page, self.view_names,
                                     self.view_pts, self.view_pandtol,
                                     self.view_spline, self.view_se,
-                                    self.tol_mode,
-                                    self.input_font, parent=self.root)
+                                    self.tol_mode, self.input_font,
+                                    name_index=self.name_index,
+                                    parent=self.root)
         self.graph_zone.grid(row=1, column=0, sticky=NSEW)
         self.control_panel = ControlPanel(heading_font=self.heading_font,
                                           input_font=self.input_font,
@@ -1994,8 +4193,11 @@ class MainApp():
             self.input_font = tkFont.nametofont('TkTextFont')
 
     def _setup_dicts(self):
-        self.sp_dict = {}  # A dictionary of smoothing parameters
+        self.sp_store = SmoothingStore()  # Smoothing values and statuses
+        self.sp_store.subscribe(self.smoothing_changed)
         self.individual_dict = {}  # A dictionary of PrefFunc objects
+        self.dataset = PFuncDataset()  # Their measures, as columns
+        self.name_index = NameIndex()  # Their names, for searching
 
     def _setup_variables(self):
         self.view_pts = IntVar()
@@ -2015,9 +4217,13 @@ class MainApp():
         self.tol_mode = StringVar()
         self.tol_floor = StringVar()
         self.strength_mode = StringVar()
+        self.spline_engine = StringVar()
+        self.bootstrap_reps = IntVar()
+        self.record_timings = IntVar()
+        self.record_memory = IntVar()
 
         self.combomode = StringVar()
-        self.messages = StringVar()
+        self.messages = message_log
 
         self.current_sp = StringVar()
         self.current_page = IntVar()
@@ -2046,15 +4252,19 @@ class MainApp():
                                     "value limit.")
         self.message_lookup[106] = ("Failed to open file because there are "
                                     "fewer stimuli than responses.")
+        self.message_lookup[107] = "Finished a group comparison."
+        self.message_lookup[108] = ("Did not exclude the trial because too "
+                                    "few trials would remain.")
+        self.message_lookup[109] = ("Appended a data file and refit the "
+                                    "individuals that gained trials.")
+        self.message_lookup[110] = ("Recording timings. A summary will "
+                                    "follow each file, refit and output.")
+        self.message_lookup[111] = ("Recording memory use. This slows PFunc "
+                                    "down until it is turned off.")
 
     def _setup_R(self):
-        current_directory = StringVar()  # For some reason it must be StrinVar
-        current_directory.set(getcwd())
-        if platform == 'win32':
-            current_directory.set(path.dirname(path.realpath(argv[0])))
-            current_directory.set(current_directory.get().replace("\\", "/"))
-        r("setwd('%s')" % current_directory.get())
-        r("source('PFunc_RCode.R')")
+        source_r_code()
+        self.fit_pool = None  # Started the first time it is needed
 
     def _setup_file_opt(self):
         self.file_opt = {}
@@ -2078,11 +4288,20 @@ class MainApp():
         self.root.bind('<<update_all_peaks>>', self.update_all_peaks)
         self.root.bind('<<update_all_tolerances>>', self.update_all_tolerances)
         self.root.bind('<<update_magenta_graphs>>', self.update_magenta_graphs)
+        self.root.bind('<<change_engine>>', self.change_engine)
+        self.root.bind('<<toggle_timings>>', self.toggle_timings)
+        self.root.bind('<<save_trace>>', self.save_trace)
+        self.root.bind('<<toggle_memory>>', self.toggle_memory)
+        self.root.bind('<<save_memory_report>>', self.save_memory_report)
         self.root.bind('<<open_message_log>>', self.open_message_log)
         self.root.bind('<<add_message>>', self.add_message)
+        self.root.bind('<<open_results_table>>', self.open_results_table)
         self.root.bind('<<open_group_spline_window>>',
                        self.open_group_spline_window)
         self.root.bind('<<add_group_spline>>', self.add_group_spline)
+        self.root.bind('<<append_data_file>>', self.append_data_file)
+        self.root.bind('<<open_group_comparison_window>>',
+                       self.open_group_comparison_window)
         self.root.bind('<<open_smoothing_file>>', self.open_smoothing_file)
         self.root.bind('<<save_smoothing_values>>', self.save_smoothing_values)
         self.root.bind('<<clear_smoothing_values>>',
@@ -2094,6 +4313,7 @@ class MainApp():
         self.root.bind('<<output_summaries>>', self.output_summaries)
         self.root.bind('<<output_points>>', self.output_points)
         self.root.bind('<<output_tol>>', self.output_tol)
+        self.root.bind('<<output_influence>>', self.output_influence)
         self.root.bind('<<quit>>', self.quit)
         self.root.bind('<<create_about_window>>', self.create_about_window)
 
@@ -2126,21 +4346,12 @@ class MainApp():
         self.view_pandtol.set(1)
         self.view_spline.set(1)
         self.view_se.set(0)
-        self.tol_type.set('relative')
-        self.tol_drop.set('1/3')
-        self.tol_absolute.set('1')
-        self.tol_mode.set('broad')
-        self.tol_floor.set('0')
-        self.loc_peak.set(0)
-        self.peak_min.set('min')
-        self.peak_max.set('max')
+        for setting in DEFAULT_FIT_SETTINGS:
+            getattr(self, setting).set(DEFAULT_FIT_SETTINGS[setting])
         if r("InCheck('min.stim', objects())")[0]:
             self.peak_min.set(r("min.stim")[0])
             self.peak_max.set(r("max.stim")[0])
-        self.strength_mode.set('Height-Dependent')
-        self.sp_lim.set(1)
-        self.sp_min.set('0.05')
-        self.sp_max.set('5')
+        self.bootstrap_reps.set(0)
         self.combomode.set('none')
 
     def _check_num_datapoints(self):
@@ -2163,8 +4374,14 @@ class MainApp():
         self.graph_zone.current_slot = ''
         self.graph_zone.page_dict.clear()
         self.graph_zone.individual_dict.clear()
-        self.sp_dict.clear()
-        r("master.gam.list <- list()")
+        self.dataset.clear()
+        self.sp_store.clear()
+        self.name_index.clear()
+        r("""master.gam.list <- list()
+             master.range.list <- list()
+             master.flat.list <- list()
+             ClearPredictionCache()
+          """)
         if self.graph_zone.view == 'mini' or self.graph_zone.view == 'mega':
             self.root.event_generate('<<add_message>>', x=101)
         self.graph_zone.loading_screen()
@@ -2176,51 +4393,17 @@ class MainApp():
             num_ind = r("length(name.vect)")[0]
         self.peak_min.set(r("min.stim")[0])
         self.peak_max.set(r("max.stim")[0])
-        for i in range(1, num_ind + 1):
-            self.sp_dict[i] = StringVar()
-            self.sp_dict[i].set('-1')
-            if self.file_type.get() == 'horizontal':
-                r("""individual_df <- data.frame(stimulus = mydata[, 1],
-                    response = mydata[, (%s + 1)])
-                    """ % i)
-            elif self.file_type.get() == 'vertical':
-                r("""individual_df <- data.frame(
-                    stimulus = mydata[, stim.column][which(mydata[, id.column]
-                                                           == name.vect[%d])],
-                    response = mydata[, resp.column][which(mydata[, id.column]
-                                                           == name.vect[%d])])
-                    """ % (i, i))
-            individual_df = r("""
-                # individual_df <- data.frame(stimulus = mydata[, 1],
-                #                             response = mydata[, (%s + 1)])
-                #names(individual_df)[2] <- name.vect[#s]
-                individual_name <- name.vect[%s]
-                individual_name_char1 <- strsplit(individual_name, "")[[1]][1]
-                allowed_characters <-
-                  "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ."
-                allowed_characters_split <- strsplit(allowed_characters,
-                                                     "")[[1]]
-                if (!InCheck(individual_name_char1, allowed_characters_split)){
-                  individual_name <- paste("X", individual_name, sep="")
-                }
-                names(individual_df)[2] <- individual_name
-                rejector <- vector()
-                for (r in 1:nrow(individual_df)) {
-                  if (is.na(individual_df[r, 2])){
-                    rejector <- c(rejector, r)
-                  }
-                }
-                if (length(rejector) > 0) {
-                  individual_df <- individual_df[-rejector, ]
-                }
-                individual_df
-            """ % (i, i))
-            self.individual_dict[i] = PrefFunc(
-                individual_df, i, self.sp_dict[i], self.current_sp,
-                self.sp_lim, self.sp_min, self.sp_max,
-                self.loc_peak, self.peak_min, self.peak_max,
-                self.tol_type, self.tol_drop, self.tol_absolute, self.tol_mode,
-                self.tol_floor, self.strength_mode)
+        with self.sp_store.batch():
+            for i in range(1, num_ind + 1):
+                individual_df = self.individual_frame(i)
+                self.individual_dict[i] = PrefFunc(
+                    individual_df, i, self.sp_store.add(i), self.current_sp,
+                    self.sp_lim, self.sp_min, self.sp_max,
+                    self.loc_peak, self.peak_min, self.peak_max,
+                    self.tol_type, self.tol_drop, self.tol_absolute,
+                    self.tol_mode, self.tol_floor, self.strength_mode,
+                    engine=self.spline_engine, dataset=self.dataset)
+        self.name_index.build(self.individual_dict)
         self.clear_display()
         self.num_pages = num_ind//9
         if num_ind//9 != num_ind/9:
@@ -2244,19 +4427,102 @@ class MainApp():
         self.root.event_generate('<<add_message>>', x=102)
         self._check_num_datapoints()
         self.root.config(cursor='')
+        self.report_usage()
         # self.root.update()
 
+    def individual_frame(self, i):
+        '''Return the data frame of the i-th individual in the open data
+        file.
+        '''
+        if self.file_type.get() == 'horizontal':
+            r("""individual_df <- data.frame(stimulus = mydata[, 1],
+                response = mydata[, (%s + 1)])
+                """ % i)
+        elif self.file_type.get() == 'vertical':
+            r("""individual_df <- data.frame(
+                stimulus = mydata[, stim.column][which(mydata[, id.column]
+                                                       == name.vect[%d])],
+                response = mydata[, resp.column][which(mydata[, id.column]
+                                                       == name.vect[%d])])
+                """ % (i, i))
+        return r("""IndividualFrame(individual_df$stimulus,
+                                    individual_df$response,
+                                    name.vect[%s])
+                 """ % i)
+
+    def append_data_file(self, event=None):
+        '''Refit only the individuals that gained trials when another data
+        file was appended to the open one (see FileMenu.append_data_file),
+        and add any new individuals after the existing splines. Smoothing
+        values set by hand are kept.
+        '''
+        try:
+            self.root.config(cursor='wait')
+        except:
+            self.root.config(cursor='watch')
+        self.root.update()
+        gained_names = list(r('gained.names'))
+        names = list(r('name.vect'))
+        individuals = [i for i in self.individual_dict
+                       if self.individual_dict[i].type == 'individual']
+        for i, name in enumerate(names, 1):
+            if i <= len(individuals):
+                if name in gained_names:
+                    self.individual_dict[individuals[i - 1]].append_trials(
+                        self.individual_frame(i))
+            else:
+                new_id = len(self.individual_dict) + 1
+                self.individual_dict[new_id] = PrefFunc(
+                    self.individual_frame(i), new_id,
+                    self.sp_store.add(new_id), self.current_sp,
+                    self.sp_lim, self.sp_min, self.sp_max,
+                    self.loc_peak, self.peak_min, self.peak_max,
+                    self.tol_type, self.tol_drop, self.tol_absolute,
+                    self.tol_mode, self.tol_floor, self.strength_mode,
+                    engine=self.spline_engine, dataset=self.dataset)
+                self.add_to_pages(new_id)
+        for individual in self.individual_dict.values():
+            individual.axes_ranges = r('range.bundle')
+        self.graph_zone.deselect_mini_graph()
+        self.graph_zone.current_slot = ''
+        self.graph_zone.mini_graphs(self.current_page.get())
+        self.graph_zone.page_total.configure(text='/ %s'
+                                             % self.graph_zone.num_pages)
+        self.graph_zone.page_num_ent.configure(textvariable=self.current_page)
+        self.root.event_generate('<<add_message>>', x=109)
+        self.root.config(cursor='')
+        self.report_usage()
+
+    def add_to_pages(self, id_number):
+        '''Put a new spline in the next free slot of the last page, starting
+        a new page if that one is full.
+        '''
+        if len(self.graph_zone.page_dict[len(self.graph_zone.page_dict)]) == 9:
+            self.graph_zone.page_dict[len(self.graph_zone.page_dict) + 1] = []
+            self.graph_zone.num_pages += 1
+            self.graph_zone.page_total.configure(text='/ %s'
+                                                 % self.graph_zone.num_pages)
+        self.graph_zone.page_dict[len(self.graph_zone.page_dict)].append(
+            id_number)
+        self.name_index.add(id_number, self.individual_dict[id_number].name)
+
     def update_summary(self, event=None):
         if self.current_col.get() != 0:
             current_individual = self.individual_dict[self.current_col.get()]
-            self.sp_dict[self.current_col.get()] = \
-                current_individual.smoothing_value
         else:
             current_individual = None
         self.control_panel.update_summary(individual=current_individual,
                                           strength_mode=self.strength_mode,
                                           tol_mode=self.tol_mode)
 
+    def smoothing_changed(self, ids):
+        '''Copy the displayed individual's smoothing value to the entry when
+        it changes (see SmoothingStore.subscribe).
+        '''
+        col = self.current_col.get()
+        if col in ids:
+            self.current_sp.set(self.sp_store.get(col))
+
     def update_sp(self, event=None):
         if self.current_col.get() != 0:
             self.current_sp.set(self.individual_dict[
@@ -2295,7 +4561,7 @@ class MainApp():
     def enter_sp(self, event=None):
         col = self.current_col.get()
         if col != 0:
-            self.sp_dict[col].set(self.current_sp.get())
+            self.sp_store.set(col, self.current_sp.get())
             self.individual_dict[col].sp_status = 'cyan'
             self.individual_dict[col].update()
             self.graph_zone.update_graph()
@@ -2318,40 +4584,178 @@ class MainApp():
             self.root.config(cursor='wait')
         except:
             self.root.config(cursor='watch')
-        for i in self.individual_dict:
-            self.individual_dict[i].update_peak()
+        if len(self.individual_dict) > 0:
+            self.update_cohort_peaks()
         self.update_all_graphs()
         self.root.config(cursor='')
+        self.report_usage()
 
     def update_all_tolerances(self, event=None):
         try:
             self.root.config(cursor='wait')
         except:
             self.root.config(cursor='watch')
-        for i in self.individual_dict:
-            self.individual_dict[i].update_tolerance()
+        if len(self.individual_dict) > 0:
+            self.update_cohort_tolerances()
         self.update_all_graphs()
         self.root.config(cursor='')
+        self.report_usage()
 
-    def update_magenta_graphs(self, event=None):
+    def affected_individuals(self, settings):
+        '''Return the id numbers of the individuals whose fits depend on any
+        of settings (see PrefFunc.depends_on).
+        '''
+        return [i for i, individual in self.individual_dict.items()
+                if any(individual.depends_on(setting)
+                       for setting in settings)]
+
+    def update_cohort_peaks(self):
+        '''Recompute, with a single call to R, the peaks that the Find Local
+        Peak settings can move. Each spline is predicted on the same adaptive
+        grid as a fresh fit, starting from a grid cached for its stimulus
+        domain (see CohortGrids in the R code).
+        '''
+        ids = self.affected_individuals(('loc_peak', 'peak_min', 'peak_max'))
+        if len(ids) == 0:
+            return
+        robjects.globalenv['affected.ids'] = robjects.IntVector(ids)
+        r('''cohort.peaks <- CohortPeaks(master.gam.list[affected.ids],
+                                        master.range.list[affected.ids],
+                                        master.flat.list[affected.ids], %s)
+          ''' % self.individual_dict[1].peak_within())
+        peak_prefs = r('cohort.peaks$peak.preference')
+        peak_resps = r('cohort.peaks$peak.response')
+        free_lowers = r('cohort.peaks$peak.free.lower')
+        free_uppers = r('cohort.peaks$peak.free.upper')
+        any_changed = False
+        for row, i in enumerate(ids):
+            if self.individual_dict[i].set_peak(
+                    peak_prefs[row], peak_resps[row],
+                    (free_lowers[row], free_uppers[row])):
+                any_changed = True
+        if self.tol_mode.get() == 'strict' and any_changed:
+            self.update_cohort_tolerances()
+
+    def update_cohort_tolerances(self):
+        '''Recompute every tolerance with a single call to R, reusing the
+        current peaks.
+        '''
+        individuals = [self.individual_dict[i]
+                       for i in sorted(self.individual_dict)]
+        instance_drop, instance_floor = individuals[0].drop_and_floor()
+        for measure in ('peak_pref', 'peak_resp'):
+            robjects.globalenv['cohort.%s' % measure] = robjects.FloatVector(
+                self.dataset.column(measure).tolist())
+        r('''cohort.tols <- CohortTolerances(master.gam.list,
+                                             master.range.list,
+                                             master.flat.list,
+                                             ifelse(is.nan(cohort.peak_pref),
+                                                    NA, cohort.peak_pref),
+                                             ifelse(is.nan(cohort.peak_resp),
+                                                    NA, cohort.peak_resp),
+                                             %s, %s)
+          ''' % (instance_drop, instance_floor))
+        broad_tols = r('cohort.tols$broad.tolerance')
+        strict_tols = r('cohort.tols$strict.tolerance')
+        broad_points = r('cohort.tols$cross.points')
+        strict_points = r('cohort.tols$strict.points')
+        tol_heights = r('cohort.tols$tolerance.height')
+        for n, individual in enumerate(individuals):
+            individual.set_tolerance(broad_tols[n], strict_tols[n],
+                                     broad_points[n], strict_points[n],
+                                     tol_heights[n])
+
+    def change_engine(self, event=None):
+        '''Refit every spline with the newly selected spline engine.
+        Smoothing values chosen by hand are kept, but note that the two
+        engines' smoothing parameters are not on exactly the same scale.
+        '''
         try:
             self.root.config(cursor='wait')
         except:
             self.root.config(cursor='watch')
         if self.graph_zone.num_pages > 0:
             for i in self.individual_dict:
-                if self.individual_dict[i].sp_status == 'magenta':
-                    # sp_lim_on = (self.sp_lim.get() == 1)
-                    # sp_too_small = (
-                    #     self.individual_dict[i].smoothing_value.get()
-                    #     < self.sp_min.get())
-                    # sp_too_big = (
-                    #     self.individual_dict[i].smoothing_value.get()
-                    #     > self.sp_max.get())
-                    # if sp_lim_on and (sp_too_small or sp_too_big):
-                    #     self.individual_dict[i].reset_sp()
-                    # elif not sp_lim_on:
-                    #     self.individual_dict[i].reset_sp()
+                self.individual_dict[i].update()
+            self.update_summary(self.current_col.get())
+            if self.graph_zone.view == 'mini' and self.current_col.get() != 0:
+                self.graph_zone.select_mini_graph(self.graph_zone.current_slot,
+                                                  and_deselect=False)
+            self.update_all_graphs()
+        self.root.config(cursor='')
+        self.report_usage()
+
+    def toggle_timings(self, event=None):
+        '''Start or stop recording how long each phase of PFunc's work
+        takes (see Tracer).
+        '''
+        tracer.clear_counters()
+        tracer.events.clear()
+        set_tracing(self.record_timings.get() == 1 or memory.enabled,
+                    keep_events=True)
+        if self.record_timings.get() == 1:
+            self.root.event_generate('<<add_message>>', x=110)
+
+    def toggle_memory(self, event=None):
+        '''Start or stop accounting for memory use (see MemoryProfiler).
+        Memory is measured at the end of the phases that the tracer times,
+        so the tracer runs while either is on.
+        '''
+        if self.record_memory.get() == 1:
+            memory.start()
+            self.root.event_generate('<<add_message>>', x=111)
+        else:
+            memory.stop()
+        set_tracing(self.record_timings.get() == 1 or memory.enabled,
+                    keep_events=True)
+
+    def report_usage(self):
+        '''Add a summary of the timings recorded since the last one, and of
+        the memory in use, to the message log.
+        '''
+        if self.record_timings.get() == 1 and len(tracer.counts) > 0:
+            self.log_message('Timings:\n' + tracer.summary())
+        tracer.clear_counters()
+        if memory.enabled:
+            self.log_message('Memory: ' + memory.heaps())
+
+    def save_memory_report(self, event=None):
+        '''Save a report of memory use, including each individual's
+        footprint and the largest objects (see MemoryProfiler.report).
+        '''
+        if not memory.enabled:
+            memory.start()
+            self.record_memory.set(1)
+            set_tracing(True, keep_events=True)
+        reportfile = filedialog.asksaveasfilename(
+            initialfile='pfunc_memory.txt', defaultextension='.txt',
+            filetypes=[('all files', '.*'), ('text files', '.txt')],
+            parent=self.root, title='Save memory report...')
+        if reportfile:
+            footprints = [individual_footprint(individual) for individual
+                          in self.individual_dict.values()]
+            with open(reportfile, 'w') as outfile:
+                outfile.write(memory.report(footprints))
+
+    def save_trace(self, event=None):
+        '''Save the recorded timings as a Chrome trace file.'''
+        tracefile = filedialog.asksaveasfilename(
+            initialfile='pfunc_trace.json', defaultextension='.json',
+            filetypes=[('all files', '.*'), ('json files', '.json')],
+            parent=self.root, title='Save timing trace...')
+        if tracefile:
+            tracer.write_chrome_trace(tracefile)
+
+    def update_magenta_graphs(self, event=None):
+        try:
+            self.root.config(cursor='wait')
+        except:
+            self.root.config(cursor='watch')
+        if self.graph_zone.num_pages > 0:
+            affected = self.affected_individuals(('sp_lim', 'sp_min',
+                                                  'sp_max'))
+            with self.sp_store.batch():
+                for i in affected:
                     self.individual_dict[i].reset_sp()
             self.update_summary(self.current_col.get())
             if self.graph_zone.view == 'mini' and self.current_col.get() != 0:
@@ -2364,45 +4768,58 @@ class MainApp():
         self.logWindow = PFuncMessages(self.root, self.messages)
 
     def add_message(self, event=None):
-        message_code = event.x
-        message_string = self.message_lookup[message_code]
-        current_datetime = str(datetime.now())
-        spc_indx = current_datetime.find(" ")
-        time_str = current_datetime[spc_indx + 1: spc_indx+6]
-        if self.messages.get() == '':
-            message_string = time_str + ' ' + message_string
-        else:
-            message_string = '\n' + time_str + ' ' + message_string
-        self.messages.set(self.messages.get() + message_string)
-        for child in self.root.winfo_children():
-            if type(child) == PFuncMessages:
-                child.add_message(message_string)
+        self.messages.add(self.message_lookup[event.x], code=event.x)
+
+    def log_message(self, message_string):
+        '''Add free text to the message log (see MessageLog).'''
+        self.messages.add(message_string)
+
+    def open_results_table(self, event=None):
+        self.results_table = ResultsTable(self.root, self.dataset,
+                                          self.tol_mode,
+                                          self.graph_zone.show_individual,
+                                          self.input_font)
 
     def open_group_spline_window(self, event=None):
         group_spline_window = GroupSplineWindow(self.root,
                                                 self.individual_dict,
+                                                self.name_index,
                                                 self.combomode,
                                                 self.input_font)
 
+    def open_group_comparison_window(self, event=None):
+        group_comparison_window = GroupComparisonWindow(
+            self.root, self.individual_dict, self.run_group_comparison,
+            self.input_font)
+
+    def run_group_comparison(self, ids_a, ids_b, n_perm):
+        '''Compare two groups of individuals (see compare_groups).'''
+        try:
+            self.root.config(cursor='wait')
+        except:
+            self.root.config(cursor='watch')
+        self.root.update()
+        results = compare_groups(self.get_fit_pool(),
+                                 [self.individual_dict[i] for i in ids_a],
+                                 [self.individual_dict[i] for i in ids_b],
+                                 n_perm)
+        self.root.event_generate('<<add_message>>', x=107)
+        self.root.config(cursor='')
+        return results
+
     def add_group_spline(self, event=None):
         newsplinedf = r('mydf')
-        self.sp_dict[(len(self.sp_dict) + 1)] = StringVar()
-        self.sp_dict[len(self.sp_dict)].set('-1')
-        self.individual_dict[(len(self.individual_dict) + 1)] = \
-            PrefFunc(newsplinedf, len(self.individual_dict) + 1,
-                     self.sp_dict[len(self.sp_dict)], self.current_sp,
+        new_id = len(self.individual_dict) + 1
+        self.individual_dict[new_id] = \
+            PrefFunc(newsplinedf, new_id,
+                     self.sp_store.add(new_id), self.current_sp,
                      self.sp_lim, self.sp_min, self.sp_max,
                      self.loc_peak, self.peak_min, self.peak_max,
                      self.tol_type, self.tol_drop, self.tol_absolute,
                      self.tol_mode, self.tol_floor, self.strength_mode,
-                     spline_type='group')
-        if len(self.graph_zone.page_dict[len(self.graph_zone.page_dict)]) == 9:
-            self.graph_zone.page_dict[len(self.graph_zone.page_dict) + 1] = []
-            self.graph_zone.num_pages += 1
-            self.graph_zone.page_total.configure(text='/ %s'
-                                                 % self.graph_zone.num_pages)
-        self.graph_zone.page_dict[len(self.graph_zone.page_dict)].append(
-            len(self.individual_dict))
+                     spline_type='group', engine=self.spline_engine,
+                     dataset=self.dataset)
+        self.add_to_pages(len(self.individual_dict))
         self.graph_zone.deselect_mini_graph()
         self.graph_zone.current_slot = ''
         self.current_page.set(len(self.graph_zone.page_dict))
@@ -2417,17 +4834,14 @@ class MainApp():
         options['title'] = 'Select a file...'
         spfile = filedialog.askopenfile(mode='r', **file_opt)
         if spfile is not None:
-            for k in self.sp_dict.keys():
-                self.sp_dict[k].set('-1')
-            lines = spfile.readlines()
+            values = read_smoothing_values(spfile)
             spfile.close()
-            for l in lines:
-                tempind = int(l.split(',')[0])
-                if tempind in self.individual_dict.keys():
-                    newsp = str(l.split(',')[1][:-1])
-                    self.sp_dict[tempind].set(newsp)
-                    self.individual_dict[tempind].sp_status = 'cyan'
-                    self.individual_dict[tempind].update()
+            try:
+                self.root.config(cursor='wait')
+            except:
+                self.root.config(cursor='watch')
+            self.apply_smoothing_values(values)
+            self.root.config(cursor='')
             if self.graph_zone.view == 'mini':
                 self.graph_zone.mini_graphs(self.current_page.get(),
                                             and_deselect=False)
@@ -2435,8 +4849,27 @@ class MainApp():
             elif self.graph_zone.view == 'mega':
                 self.graph_zone.update_mega_graph()
                 self.update_summary()
-                self.current_sp.set(self.individual_dict[
-                    self.current_col.get()].smoothing_value)
+
+    def apply_smoothing_values(self, values):
+        '''Give the individuals in values (id number: smoothing value) those
+        smoothing values, and every other individual the default one. Only
+        the individuals whose value or status actually changes are refit,
+        in one pass once all the values have been stored.
+        '''
+        values = dict((i, value) for i, value in values.items()
+                      if i in self.individual_dict)
+        adjusted = [i for i, value in values.items()
+                    if self.sp_store.status(i) != 'cyan'
+                    or self.sp_store.get(i) != value]
+        cleared = [i for i in self.sp_store.ids('cyan') if i not in values]
+        with self.sp_store.batch():
+            if len(adjusted) > 0:
+                self.sp_store.set_many(dict((i, values[i]) for i in adjusted),
+                                       status='cyan')
+            self.sp_store.reset(cleared)
+            for i in sorted(adjusted + cleared):
+                self.individual_dict[i].update()
+        self.report_usage()
 
     def save_smoothing_values(self, event=None):
         if platform == 'win32':
@@ -2458,12 +4891,9 @@ class MainApp():
             spfile.close()
 
     def clear_smoothing_values(self, event=None):
-        for i in self.individual_dict:
-            if self.individual_dict[i].sp_status == 'cyan':
-                temp_individual_id = self.individual_dict[i].id_number
-                self.sp_dict[temp_individual_id].set('-1')
-                self.individual_dict[i].update()
-                self.individual_dict[i].sp_status = 'magenta'
+        with self.sp_store.batch():
+            for i in self.sp_store.ids('cyan'):
+                self.individual_dict[i].reset_sp()
         self.graph_zone.mini_graphs(self.current_page.get(),
                                     and_deselect=False)
         self.graph_zone.fig.canvas.draw()
@@ -2488,6 +4918,10 @@ class MainApp():
             self.sp_lim.set(usrSett['sp_lim'])
             self.sp_min.set(usrSett['sp_min'])
             self.sp_max.set(usrSett['sp_max'])
+            if 'spline_engine' in usrSett:
+                self.spline_engine.set(usrSett['spline_engine'])
+            if 'bootstrap_reps' in usrSett:
+                self.bootstrap_reps.set(usrSett['bootstrap_reps'])
         usrSett.close()
         self.control_panel.smoothing_limits_box.sp_lim_toggle(andupdate=False)
         self.control_panel.peak_box.loc_peak_toggle(andupdate=False)
@@ -2513,6 +4947,8 @@ class MainApp():
         usrSett['sp_lim'] = self.sp_lim.get()
         usrSett['sp_min'] = self.sp_min.get()
         usrSett['sp_max'] = self.sp_max.get()
+        usrSett['spline_engine'] = self.spline_engine.get()
+        usrSett['bootstrap_reps'] = self.bootstrap_reps.get()
         usrSett.close()
 
     def reset_settings(self, event=None):
@@ -2598,6 +5034,7 @@ class MainApp():
             graphfile.close()
             self.root.config(cursor='')
 
+    @traced('render')
     def draw_one_graph_in_r(self, individual):
         individual.update()
         isSubmerged = individual.tolerance_height > individual.peak_resp
@@ -2620,7 +5057,7 @@ class MainApp():
              is.flat <- CheckForFlat(individual_data, 2)
              #is.flat <- CheckForFlat(#s, 2)
              #if (sd(#s) == 0) {flat <- TRUE}
-        ''' % (individual.r_data_frame.r_repr(),
+        ''' % (individual.fit_frame(),
                individual.peak_resp,
                individual.peak_pref,
                individual.spline_x.r_repr(),
@@ -2677,37 +5114,22 @@ class MainApp():
                                             parent=self.root,
                                             title='Save spline summaries...')
         if summfile is not None:
-            r('''output <- data.frame(name = rep(NA, %s),
-                           peak_pref=NA, peak_height=NA, tolerance=NA,
-                           strength=NA,
-                           #HD_strength=NA, HI_strength=NA,
-                           responsiveness=NA, smoothing=NA)
-            ''' % len(self.individual_dict))
             for i in self.individual_dict:
-                tempind = self.individual_dict[i]
-                tempind.update()
-                if self.tol_mode.get() == 'broad':
-                    temp_tolerance = self.individual_dict[i].broad_tolerance
-                elif self.tol_mode.get() == 'strict':
-                    temp_tolerance = self.individual_dict[i].strict_tolerance
-                if self.strength_mode.get() == 'Height-Dependent':
-                    temp_strength = tempind.hd_strength
-                elif self.strength_mode.get() == 'Height-Independent':
-                    temp_strength = tempind.hi_strength
-                r('''output[%s, 1] <- '%s'
-                     output[%s, 2:7] <- c(%s, %s, %s, %s, %s, %s)
-                ''' % (i, tempind.name, i, tempind.peak_pref,
-                       tempind.peak_resp,
-                       temp_tolerance, temp_strength,
-                       tempind.responsiveness, tempind.smoothing_value.get()))
-            r("write.csv(output, '%s', row.names = FALSE)" % summfile.name)
+                self.individual_dict[i].update()
+                self.individual_dict[i].bootstrap = None
+            if self.bootstrap_reps.get() > 0:
+                self.bootstrap_cohort()
+            write_summaries(summfile.name, list(self.individual_dict.values()),
+                            self.tol_mode.get(), self.strength_mode.get())
             summfile.close()
             self.root.config(cursor='')
+        self.report_usage()
 
     def output_points(self, event=None):
         '''Output a csv file of points that make up the splines in every graph.
-        The continuous curves of the splines are broken into 200 equally spaced
-        points. These points can then be used to plot splines in other
+        The continuous curves of the splines are broken into points that are
+        closest together where the curves bend most (see AdaptiveGrid in
+        PFunc_RCode.R). These points can then be used to plot splines in other
         programs. x- and y-values are output for each individual, and if the
         Standard Error setting is toggled on in the View settings, then
         standard error points of the spline are output as well.
@@ -2728,22 +5150,13 @@ class MainApp():
                                              parent=self.root,
                                              title='Select a file...')
         if pointfile is not None:
-            r("output <- data.frame(x = rep(NA, 201))")
             for i in self.individual_dict:
-                tempind = self.individual_dict[i]
-                tempind.update()
-                r('''output$%s_stimulus <- %s
-                     output$%s_response <- %s''' % (tempind.name,
-                                                    tempind.spline_x.r_repr(),
-                                                    tempind.name,
-                                                    tempind.spline_y.r_repr()))
-                if self.view_se.get() == 1:
-                    r('output$%s_se <- %s'
-                        % (tempind.name, tempind.se.r_repr()))
-            r('output <- output[2:ncol(output)]')
-            r('write.csv(output, "%s", row.names = FALSE)' % pointfile.name)
+                self.individual_dict[i].update()
+            write_points(pointfile.name, list(self.individual_dict.values()),
+                         self.view_se.get() == 1)
             pointfile.close()
             self.root.config(cursor='')
+        self.report_usage()
 
     def output_tol(self, event=None):
         '''Tolerance is the width of the spline at a certain height. In the
@@ -2766,33 +5179,886 @@ class MainApp():
             filetypes=[('all files', '.*'), ('csv files', '.csv')],
             parent=self.root, title='Select a file...')
         if pointfile is not None:
-            output_tol_table = ''
-            for i in range(1, len(self.individual_dict) + 1):
-                individual_name = self.individual_dict[i].name
-                if self.tol_mode.get() == 'broad':
-                    individual_tol_pts = (
-                        self.individual_dict[i].broad_tolerance_points)
-                elif self.tol_mode.get() == 'strict':
-                    individual_tol_pts = (
-                        self.individual_dict[i].strict_tolerance_points)
-                tol_pts_str = ''
-                for i in individual_tol_pts:
-                    tol_pts_str = tol_pts_str + str(i) + ', '
-                tol_pts_str = tol_pts_str[: -2]
-                output_row = individual_name + ', ' + tol_pts_str
-                if i != (len(self.individual_dict) + 1):
-                    output_row += '\n'
-                output_tol_table += output_row
-            pointfile.write(output_tol_table)
             pointfile.close()
+            write_tolerance_points(pointfile.name,
+                                   list(self.individual_dict.values()),
+                                   self.tol_mode.get())
             self.root.config(cursor='')
+        self.report_usage()
+
+    def output_influence(self, event=None):
+        '''Output a csv file with the leverage, leave-one-out residual and
+        Cook's distance of every trial, for screening the whole cohort for
+        influential points.
+        '''
+        try:
+            self.root.config(cursor='wait')
+        except:
+            self.root.config(cursor='watch')
+        if platform == 'win32':
+            ext = ''
+        else:
+            ext = '.csv'
+        influencefile = filedialog.asksaveasfile(
+            mode='w', initialfile='trial_influence.csv', defaultextension=ext,
+            filetypes=[('all files', '.*'), ('csv files', '.csv')],
+            parent=self.root, title='Select a file...')
+        if influencefile is not None:
+            influencefile.close()
+            write_influence(influencefile.name,
+                            list(self.individual_dict.values()))
+        self.root.config(cursor='')
+        self.report_usage()
+
+    def fit_settings(self):
+        '''Return the current fitting settings as plain values (see
+        DEFAULT_FIT_SETTINGS).
+        '''
+        settings = {}
+        for setting in DEFAULT_FIT_SETTINGS:
+            settings[setting] = getattr(self, setting).get()
+        return settings
+
+    def get_fit_pool(self):
+        '''Return the pool of fitting processes, starting it if needed.'''
+        if self.fit_pool is None:
+            self.fit_pool = FitPool()
+        return self.fit_pool
+
+    def bootstrap_cohort(self):
+        '''Compute bootstrap confidence intervals for every individual on the
+        worker pool and attach them to the individuals for output.
+        '''
+        settings = self.fit_settings()
+        tasks = [individual_task(individual, settings,
+                                 self.bootstrap_reps.get())
+                 for individual in self.individual_dict.values()]
+        if tracer.enabled:
+            tasks = [dict(task, trace=True) for task in tasks]
+        for task, result, reason in self.get_fit_pool().isolated_imap(
+                fit_individual, tasks):
+            if result is not None:
+                self.individual_dict[result.id_number].bootstrap = \
+                    result.bootstrap
+                if result.trace is not None:
+                    tracer.merge(result.trace)
 
     def quit(self, event=None):
+        if self.fit_pool is not None:
+            self.fit_pool.shutdown()
         self.root.quit()
 
     def create_about_window(self, event=None):
         self.about_window = AboutWindow(self, self.about_font1)
 
+def parse_arguments(arguments):
+    '''Parse PFunc's command line. Without --batch, the GUI is started.'''
+    parser = argparse.ArgumentParser(
+        prog='PFunc.py',
+        description='Fit preference functions. Without --batch, the PFunc '
+                    'GUI is started.')
+    parser.add_argument('--batch', metavar='DATAFILE',
+                        help='fit every individual in a data file without '
+                             'the GUI')
+    parser.add_argument('--append', metavar='DATAFILE',
+                        help='add the trials in a data file to those of the '
+                             'last batch run with the same --output, and '
+                             'refit only the individuals that gained trials')
+    parser.add_argument('--watch', metavar='DIRECTORY',
+                        help='keep fitting the data files that appear in a '
+                             'directory, writing the outputs next to them')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='serve fit requests over HTTP on this port of '
+                             'localhost')
+    parser.add_argument('--socket', metavar='PATH',
+                        help='serve fit requests over HTTP on this Unix '
+                             'socket')
+    parser.add_argument('--shard', type=shard_argument, metavar='I/N',
+                        help='with --batch, fit only the I-th of N parts of '
+                             'the individuals, for combining with --merge')
+    parser.add_argument('--merge', metavar='DIRECTORY',
+                        help='combine the results of every --shard run that '
+                             'wrote to a directory into the usual outputs')
+    parser.add_argument('--interval', type=float, default=5,
+                        metavar='SECONDS',
+                        help='how often --watch looks for new files')
+    parser.add_argument('--vertical', metavar='ID,STIMULUS,RESPONSE',
+                        help='the data file is vertical, with these id, '
+                             'stimulus and response columns (with --watch, '
+                             'files without them are read as horizontal)')
+    parser.add_argument('--output', metavar='DIRECTORY', default='.',
+                        help='where to write spline_summaries.csv, '
+                             'spline_points.csv and tolerance_points.csv, '
+                             'and to keep the results for --append')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: one per '
+                             'CPU)')
+    parser.add_argument('--timeout', type=float, default=FIT_TIMEOUT,
+                        metavar='SECONDS',
+                        help='give up on an individual whose fit takes longer '
+                             'than this (0 for no limit)')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='time each phase of a batch run, print a '
+                             'summary and write a Chrome trace file')
+    parser.add_argument('--memory', metavar='FILE',
+                        help='account for memory use in a batch run and '
+                             'write a report to FILE')
+    parser.add_argument('--log', metavar='FILE',
+                        help='write the message log to FILE as JSON lines, '
+                             'starting a new file every 1 MB')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='add 95%% confidence intervals from N bootstrap '
+                             'replicates to the summaries')
+    parser.add_argument('--seed', type=int, default=BOOTSTRAP_SEED,
+                        help='random seed for the bootstrap replicates')
+    parser.add_argument('--se', action='store_true',
+                        help='include standard errors in spline_points.csv')
+    parser.add_argument('--saved-settings', action='store_true',
+                        help='use the settings last saved in the GUI instead '
+                             'of the defaults')
+    # macOS adds a -psn_ argument when PFunc is opened from the Finder
+    arguments = [argument for argument in arguments
+                 if not argument.startswith('-psn_')]
+    parsed = parser.parse_args(arguments)
+    if parsed.shard is not None and parsed.batch is None:
+        parser.error('--shard only works with --batch')
+    if parsed.socket is not None and \
+            not hasattr(socketserver, 'UnixStreamServer'):
+        parser.error('--socket needs Unix sockets, which %s does not have'
+                     % platform)
+    return parsed
+
+
+def shard_argument(value):
+    '''Read a --shard value such as 2/8 as (2, 8).'''
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected I/N, e.g. 2/8')
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('I must be between 1 and N')
+    return index, count
+
+
+def shard_of(name, count):
+    '''Return which of count shards (from 1) an individual belongs to. It
+    depends only on the name, so every node partitions a file the same way
+    without talking to the others.
+    '''
+    return zlib.crc32(name.encode()) % count + 1
+
+
+def batch_settings(arguments):
+    '''Return the fitting settings for a batch run: the defaults, or the
+    settings saved from the GUI.
+    '''
+    settings = dict(DEFAULT_FIT_SETTINGS)
+    if arguments.saved_settings:
+        usrSett = shelve.open('UserSettings')
+        for setting in settings:
+            if setting in usrSett:
+                settings[setting] = usrSett[setting]
+        usrSett.close()
+    return settings
+
+
+def append_tasks(output, run_options, new_tasks):
+    '''Add the trials of new_tasks to those of the same individuals (by
+    name) from the last batch run in the output directory (see save_batch).
+    Returns the combined tasks, with new individuals at the end, and the
+    previous results of those that gained no trials, with None for the
+    individuals that need to be fit. Everyone is refit if the last run used
+    other settings.
+    '''
+    store = shelve.open(path.join(output, BATCH_STORE))
+    tasks = []
+    results = []
+    if 'tasks' in store and store['options'] == run_options:
+        tasks = store['tasks']
+        results = store['results']
+    elif 'tasks' in store:
+        tasks = store['tasks']
+        results = [None] * len(tasks)
+    store.close()
+    positions = {}
+    for i, task in enumerate(tasks):
+        positions[task['name']] = i
+    for new_task in new_tasks:
+        if len(new_task['stimulus']) == 0:
+            continue
+        if new_task['name'] in positions:
+            task = tasks[positions[new_task['name']]]
+            task['stimulus'] = task['stimulus'] + new_task['stimulus']
+            task['response'] = task['response'] + new_task['response']
+            task['settings'] = new_task['settings']
+            task['bootstrap'] = new_task['bootstrap']
+            task['seed'] = new_task['seed']
+            results[positions[new_task['name']]] = None
+        else:
+            new_task['id'] = len(tasks) + 1
+            positions[new_task['name']] = len(tasks)
+            tasks.append(new_task)
+            results.append(None)
+    return tasks, results
+
+
+def save_batch(output, run_options, tasks, results):
+    '''Keep the trials and results of a batch run in the output directory,
+    so that a later run with --append only has to fit the individuals that
+    gained trials.
+    '''
+    store = shelve.open(path.join(output, BATCH_STORE))
+    store['options'] = run_options
+    store['tasks'] = tasks
+    store['results'] = results
+    store.close()
+
+
+def content_hash(value):
+    '''Return a SHA-256 digest of plain Python values, for recognising the
+    same data or settings in a later run.
+    '''
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BatchCheckpoint():
+    '''A record of the individuals fit so far in a batch run, kept in the
+    output directory so that a run that is killed partway through can carry
+    on where it stopped. Each result is committed as soon as it is fit,
+    under hashes of the data and of the settings, so a rerun only reuses
+    results that it would have produced itself. Each --shard (given as
+    (I, N)) has a file of its own, without a write-ahead log, because shards
+    may only share a network filesystem, on which SQLite's write-ahead log
+    does not work.
+    '''
+    def __init__(self, output, tasks, run_options, shard=None):
+        if shard is None:
+            self.connection = sqlite3.connect(path.join(output,
+                                                        CHECKPOINT_STORE))
+            self.connection.execute('PRAGMA journal_mode = WAL')
+        else:
+            self.connection = sqlite3.connect(path.join(
+                output, SHARD_CHECKPOINT % shard))
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                     dataset TEXT, settings TEXT,
+                                     id INTEGER, result BLOB,
+                                     PRIMARY KEY (dataset, settings, id))''')
+        self.connection.commit()
+        dataset = [(task['id'], task['name'], task['type'], task['stimulus'],
+                    task['response'], task['smoothing']) for task in tasks]
+        self.key = (content_hash(dataset), content_hash(run_options))
+
+    def load(self):
+        '''Return the results already fit, by id number.'''
+        results = {}
+        for id_number, result in self.connection.execute(
+                '''SELECT id, result FROM results
+                   WHERE dataset = ? AND settings = ?''', self.key):
+            results[id_number] = pickle.loads(result)
+        return results
+
+    def save(self, result):
+        '''Commit one FitResult.'''
+        self.connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+            self.key + (result.id_number, pickle.dumps(result)))
+        self.connection.commit()
+
+    def finish(self):
+        '''Forget the results of a run whose outputs have been written.'''
+        self.connection.execute(
+            'DELETE FROM results WHERE dataset = ? AND settings = ?',
+            self.key)
+        self.connection.commit()
+        self.connection.close()
+
+
+def run_batch(arguments):
+    '''Fit every individual in a data file on a pool of worker processes and
+    write the same summaries, spline points and tolerance points files as the
+    File menu. With --append, only the individuals that gained trials since
+    the last run are fit. Results are checkpointed as they are fit (see
+    BatchCheckpoint), so rerunning a run that was killed only fits the
+    individuals it had not reached.
+    '''
+    source_r_code()
+    settings = batch_settings(arguments)
+    run_options = (settings, arguments.bootstrap, arguments.seed)
+    columns = None
+    if arguments.vertical is not None:
+        columns = arguments.vertical.split(',')
+    if arguments.append is not None:
+        new_tasks = read_tasks(arguments.append, settings, columns,
+                               arguments.bootstrap, arguments.seed)
+        tasks, results = append_tasks(arguments.output, run_options,
+                                      new_tasks)
+    else:
+        tasks = read_tasks(arguments.batch, settings, columns,
+                           arguments.bootstrap, arguments.seed)
+        results = [None] * len(tasks)
+    if arguments.shard is not None:
+        shard_index, shard_count = arguments.shard
+        tasks = [task for task in tasks
+                 if shard_of(task['name'], shard_count) == shard_index]
+    checkpoint = BatchCheckpoint(arguments.output, tasks, run_options,
+                                 arguments.shard)
+    for id_number, result in checkpoint.load().items():
+        if results[id_number - 1] is None:
+            results[id_number - 1] = result
+    pending = [task for task in tasks if results[task['id'] - 1] is None]
+    if arguments.trace is not None:
+        set_tracing(True, keep_events=True)
+        pending = [dict(task, trace=True) for task in pending]
+    if arguments.memory is not None:
+        pending = [dict(task, memory=True) for task in pending]
+    failures = []
+    start = perf_counter()
+    if len(pending) > 0:
+        with FitPool(arguments.workers, arguments.timeout) as pool:
+            for task, result, reason in pool.isolated_imap(fit_individual,
+                                                           pending):
+                if result is None:
+                    failures.append((task, reason))
+                    message_log.add('Fit failed: %s' % reason,
+                                    individual=task['name'])
+                    continue
+                if result.trace is not None:
+                    tracer.merge(result.trace)
+                    result.trace = None
+                results[result.id_number - 1] = result
+                checkpoint.save(result)
+    if arguments.shard is not None:
+        results = [results[task['id'] - 1] for task in tasks]
+        save_shard(arguments, run_options, tasks, results, failures)
+    else:
+        write_batch_outputs(path.join(arguments.output, ''),
+                            [result for result in results
+                             if result is not None],
+                            settings, arguments.se)
+        write_failures(path.join(arguments.output, 'failures.csv'),
+                       failures)
+        save_batch(arguments.output, run_options, tasks, results)
+    checkpoint.finish()
+    message_log.add('Fit %d of %d individual(s), %d failed'
+                    % (len(pending) - len(failures), len(tasks),
+                       len(failures)), duration=perf_counter() - start)
+    if arguments.trace is not None:
+        tracer.write_chrome_trace(arguments.trace)
+        print(tracer.summary())
+    if arguments.memory is not None:
+        with open(arguments.memory, 'w') as reportfile:
+            reportfile.write(memory.report(
+                [result.footprint for result in results
+                 if result is not None and result.footprint is not None],
+                this_process=False))
+
+
+def save_shard(arguments, run_options, tasks, results, failures):
+    '''Write the partial outputs of a --shard run, and keep its results for
+    merge_shards. The results file is written under a temporary name and
+    then renamed, so a merge never sees a half-written shard.
+    '''
+    shard_index, shard_count = arguments.shard
+    store_name = path.join(arguments.output,
+                           SHARD_STORE % (shard_index, shard_count))
+    prefix = store_name[:-len('.pickle')] + '_'
+    write_batch_outputs(prefix, [result for result in results
+                                 if result is not None],
+                        run_options[0], arguments.se)
+    write_failures(prefix + 'failures.csv', failures)
+    with open(store_name + '.tmp', 'wb') as store:
+        pickle.dump({'shard': arguments.shard, 'options': run_options,
+                     'data': path.basename(arguments.batch),
+                     'se': arguments.se, 'tasks': tasks,
+                     'results': results, 'failures': failures}, store)
+    replace_file(store_name + '.tmp', store_name)
+
+
+def merge_shards(output):
+    '''Combine the results of the --shard runs in the output directory
+    into the summaries, spline points and tolerance points files that a
+    single batch run would have written, with the individuals in the order
+    of the data file.
+    '''
+    shards = {}
+    for name in listdir(output):
+        if name.startswith('PFuncShard-') and name.endswith('.pickle'):
+            with open(path.join(output, name), 'rb') as store:
+                shard = pickle.load(store)
+            shards[shard['shard']] = shard
+    if len(shards) == 0:
+        raise SystemExit('No shards to merge in %s' % output)
+    first = shards[min(shards)]
+    shard_count = first['shard'][1]
+    for shard in shards.values():
+        if (shard['shard'][1] != shard_count or
+                shard['options'] != first['options'] or
+                shard['data'] != first['data']):
+            raise SystemExit('The shards in %s are not from the same run'
+                             % output)
+    missing = [str(index) for index in range(1, shard_count + 1)
+               if (index, shard_count) not in shards]
+    if len(missing) > 0:
+        raise SystemExit('Missing shard(s) %s of %d in %s'
+                         % (', '.join(missing), shard_count, output))
+    tasks = []
+    results = []
+    failures = []
+    for shard in shards.values():
+        tasks.extend(shard['tasks'])
+        results.extend(zip(shard['tasks'], shard['results']))
+        failures.extend(shard['failures'])
+    tasks.sort(key=lambda task: task['id'])
+    results.sort(key=lambda pair: pair[0]['id'])
+    results = [result for task, result in results]
+    failures.sort(key=lambda failure: failure[0]['id'])
+    write_batch_outputs(path.join(output, ''),
+                        [result for result in results if result is not None],
+                        first['options'][0], first['se'])
+    write_failures(path.join(output, 'failures.csv'), failures)
+    save_batch(output, first['options'], tasks, results)
+
+
+@traced('parse')
+def read_smoothing_values(spfile):
+    '''Read a smoothing file, as written by Save Smoothing Values (one
+    "id number,smoothing value" line per adjusted individual), and return a
+    dict of id number: smoothing value.
+    '''
+    values = {}
+    for row in csv.reader(spfile):
+        if len(row) >= 2:
+            values[int(row[0])] = row[1].strip()
+    return values
+
+
+@traced('export')
+def write_failures(file_name, failures):
+    '''Write a csv file of the individuals that could not be fit, as
+    (task, reason) pairs, with the reason for each.
+    '''
+    with open(file_name, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['name', 'reason'])
+        for task, reason in failures:
+            writer.writerow([task['name'], reason])
+
+
+def write_batch_outputs(prefix, results, settings, with_se=False):
+    '''Write the summaries, spline points and tolerance points files of a
+    batch run, with file names that start with prefix.
+    '''
+    write_summaries(prefix + 'spline_summaries.csv', results,
+                    settings['tol_mode'], settings['strength_mode'])
+    write_points(prefix + 'spline_points.csv', results, with_se)
+    write_tolerance_points(prefix + 'tolerance_points.csv', results,
+                           settings['tol_mode'])
+
+
+class FolderWatcher():
+    '''Fits the data files that land in a directory, writing each one's
+    outputs next to it (see write_batch_outputs). Files are read as vertical
+    if they have the given id, stimulus and response columns, and as
+    horizontal otherwise. A state database in the directory records which
+    versions of which files have been fit, so a restarted watcher skips them
+    and picks up the rest, and a file is fit again when it changes.
+    '''
+    def __init__(self, directory, settings, columns=None, n_boot=0,
+                 seed=BOOTSTRAP_SEED, with_se=False, interval=5):
+        self.directory = directory
+        self.settings = settings
+        self.columns = columns
+        self.n_boot = n_boot
+        self.seed = seed
+        self.with_se = with_se
+        self.interval = interval
+        self.state = sqlite3.connect(path.join(directory, WATCH_STATE))
+        self.state.execute('''CREATE TABLE IF NOT EXISTS files (
+                                name TEXT PRIMARY KEY, mtime REAL,
+                                size INTEGER, status TEXT, message TEXT)''')
+        self.state.commit()
+
+    def pending_files(self):
+        '''Return the data files that are new or have changed since they
+        were last fit, oldest first. A file that was modified within the last
+        interval may still be being copied, so it waits for the next poll.
+        '''
+        now = time()
+        pending = []
+        for name in listdir(self.directory):
+            file_name = path.join(self.directory, name)
+            if (not name.lower().endswith(WATCH_EXTENSIONS) or
+                    name.endswith(WATCH_OUTPUTS) or
+                    not path.isfile(file_name)):
+                continue
+            file_stat = stat(file_name)
+            if now - file_stat.st_mtime < self.interval:
+                continue
+            record = self.state.execute(
+                'SELECT mtime, size FROM files WHERE name = ?',
+                (name,)).fetchone()
+            if record != (file_stat.st_mtime, file_stat.st_size):
+                pending.append((file_stat.st_mtime, name, file_stat))
+        pending.sort()
+        return [(name, file_stat) for mtime, name, file_stat in pending]
+
+    def record(self, name, file_stat, status, message=''):
+        '''Note in the state database how a version of a file was handled.'''
+        self.state.execute('''INSERT OR REPLACE INTO files
+                              VALUES (?, ?, ?, ?, ?)''',
+                           (name, file_stat.st_mtime, file_stat.st_size,
+                            status, message))
+        self.state.commit()
+
+    def fit_files(self, pool, files):
+        '''Fit a group of files together, so that small files still keep
+        every worker busy, and write their outputs.
+        '''
+        file_tasks = []
+        for name, file_stat in files:
+            try:
+                tasks = read_tasks(path.join(self.directory, name),
+                                   self.settings, self.columns, self.n_boot,
+                                   self.seed, detect=True)
+            except Exception as error:
+                self.record(name, file_stat, 'failed', str(error))
+                message_log.add('Could not read %s: %s' % (name, error))
+                continue
+            file_tasks.append((name, file_stat, tasks))
+        if len(file_tasks) == 0:
+            return
+        all_tasks = [task for name, file_stat, tasks in file_tasks
+                     for task in tasks]
+        fit_start = perf_counter()
+        outcomes = list(pool.isolated_imap(fit_individual, all_tasks))
+        message_log.add('Fit %d file(s)' % len(file_tasks),
+                        duration=perf_counter() - fit_start)
+        start = 0
+        for name, file_stat, tasks in file_tasks:
+            file_outcomes = outcomes[start:start + len(tasks)]
+            start += len(tasks)
+            results = [result for task, result, reason in file_outcomes
+                       if result is not None]
+            failures = [(task, reason) for task, result, reason
+                        in file_outcomes if result is None]
+            prefix = path.splitext(path.join(self.directory, name))[0] + '_'
+            write_batch_outputs(prefix, results, self.settings, self.with_se)
+            if len(failures) > 0:
+                write_failures(prefix + 'failures.csv', failures)
+                self.record(name, file_stat, 'done',
+                            '%d individual(s) failed' % len(failures))
+            else:
+                self.record(name, file_stat, 'done')
+            message_log.add('Fit %s: %d individual(s), %d failed'
+                            % (name, len(tasks), len(failures)))
+
+    def run(self, pool):
+        '''Poll the directory until interrupted, fitting at most WATCH_GROUP
+        files at a time on the pool.
+        '''
+        while True:
+            pending = self.pending_files()
+            for start in range(0, len(pending), WATCH_GROUP):
+                self.fit_files(pool, pending[start:start + WATCH_GROUP])
+            if len(pending) == 0:
+                sleep(self.interval)
+
+
+def run_watch(arguments):
+    '''Watch a directory and fit the data files that land in it (see
+    FolderWatcher) until interrupted.
+    '''
+    source_r_code()
+    columns = None
+    if arguments.vertical is not None:
+        columns = arguments.vertical.split(',')
+    watcher = FolderWatcher(arguments.watch, batch_settings(arguments),
+                            columns, arguments.bootstrap, arguments.seed,
+                            arguments.se, arguments.interval)
+    with FitPool(arguments.workers, arguments.timeout) as pool:
+        try:
+            watcher.run(pool)
+        except KeyboardInterrupt:
+            pass
+
+
+def service_array(values):
+    '''Read an array from a service request: either a JSON list of numbers
+    or a base64 string of little-endian 64-bit floats.
+    '''
+    if isinstance(values, str):
+        numbers = array('d')
+        numbers.frombytes(base64.b64decode(values))
+        if sys_byteorder == 'big':
+            numbers.byteswap()
+        return list(numbers)
+    return [float(value) for value in values]
+
+
+def service_binary(values):
+    '''Encode numbers as a base64 string of little-endian 64-bit floats,
+    with NaN for missing values (the reverse of service_array).
+    '''
+    numbers = array('d', [float('nan') if value is None else value
+                          for value in values])
+    if sys_byteorder == 'big':
+        numbers.byteswap()
+    return base64.b64encode(numbers.tobytes()).decode('ascii')
+
+
+def service_number(value):
+    '''Convert a measure as printed by R to a float, or None for NA.'''
+    if value is None or value == 'NA':
+        return None
+    return float(value)
+
+
+def service_tasks(request, base_settings):
+    '''Turn a fit request into fit_tasks. A request is a dict with a list
+    of individuals, each with a name, stimulus and response arrays (see
+    service_array) and optionally a smoothing value, plus optional settings
+    that override base_settings, bootstrap replicates and seed.
+    '''
+    settings = dict(base_settings)
+    for setting, value in request.get('settings', {}).items():
+        if setting not in settings:
+            raise ValueError('Unknown setting: %s' % setting)
+        settings[setting] = value
+    tasks = []
+    for i, individual in enumerate(request['individuals'], 1):
+        tasks.append(fit_task(
+            i, individual.get('name', 'individual%d' % i),
+            service_array(individual['stimulus']),
+            service_array(individual['response']), settings,
+            smoothing=str(individual.get('smoothing', '-1')),
+            n_boot=int(request.get('bootstrap', 0)),
+            seed=int(request.get('seed', BOOTSTRAP_SEED))))
+    return tasks
+
+
+def service_record(result, binary=False):
+    '''Describe a FitResult for a service response: its measures, and its
+    curve as lists of numbers or, if binary is True, base64 arrays (see
+    service_binary).
+    '''
+    curve = {}
+    for column, values in zip(('stimulus', 'response', 'se'),
+                              result.export_points()):
+        curve[column] = [None if value != value else value  # NA is NaN
+                         for value in values]
+    if binary:
+        for column in curve:
+            curve[column] = service_binary(curve[column])
+    record = {'name': result.name,
+              'peak_preference': service_number(result.peak_pref),
+              'peak_height': service_number(result.peak_resp),
+              'broad_tolerance': service_number(result.broad_tolerance),
+              'strict_tolerance': service_number(result.strict_tolerance),
+              'hd_strength': service_number(result.hd_strength),
+              'hi_strength': service_number(result.hi_strength),
+              'responsiveness': service_number(result.responsiveness),
+              'smoothing': service_number(result.smoothing_value.get()),
+              'curve': curve}
+    if result.bootstrap is not None:
+        record['intervals'] = {}
+        for measure, bounds in result.bootstrap.items():
+            record['intervals'][measure.replace('.', '_')] = [
+                service_number(bound) for bound in bounds]
+    return record
+
+
+class FitService():
+    '''Fits requests from other programs on a pool of warm workers, either
+    straight away or as numbered jobs that are collected later.
+    '''
+    def __init__(self, settings, workers=None, timeout=None):
+        self.settings = settings
+        self.pool = FitPool(workers, timeout)
+        self.job_runner = ThreadPoolExecutor(max_workers=SERVICE_JOBS)
+        self.jobs = {}
+        self.finished = {}  # Finished jobs, least recently checked first
+        self.job_lock = threading.Lock()
+        self.job_count = 0
+
+    def fit(self, request):
+        '''Fit a request (see service_tasks) and return its results.'''
+        binary = bool(request.get('binary', False))
+        records = []
+        start = perf_counter()
+        for task, result, reason in self.pool.isolated_imap(
+                fit_individual, service_tasks(request, self.settings)):
+            if result is None:
+                records.append({'name': task['name'], 'error': reason})
+                message_log.add('Fit failed: %s' % reason,
+                                individual=task['name'])
+            else:
+                records.append(service_record(result, binary))
+        message_log.add('Fit a request of %d individual(s)' % len(records),
+                        duration=perf_counter() - start)
+        return {'results': records}
+
+    def submit(self, request):
+        '''Start fitting a request in the background and return its job
+        number.
+        '''
+        service_tasks(request, self.settings)  # Reject bad requests now
+        with self.job_lock:
+            self.job_count += 1
+            job_id = self.job_count
+            future = self.job_runner.submit(self.fit, request)
+            self.jobs[job_id] = future
+        future.add_done_callback(lambda future: self.finish(job_id))
+        return job_id
+
+    def finish(self, job_id):
+        '''Keep the results of a job that has just finished, forgetting those
+        of the job checked least recently once there are more than
+        SERVICE_FINISHED.
+        '''
+        with self.job_lock:
+            self.finished[job_id] = True
+            while len(self.finished) > SERVICE_FINISHED:
+                oldest = next(iter(self.finished))
+                del self.finished[oldest]
+                del self.jobs[oldest]
+
+    def expired(self, job_id):
+        '''Return whether job_id was a job whose results have been
+        forgotten (see finish).
+        '''
+        with self.job_lock:
+            return 0 < job_id <= self.job_count and job_id not in self.jobs
+
+    def job(self, job_id):
+        '''Return the status of a job, with its results once it is done.'''
+        with self.job_lock:
+            future = self.jobs[job_id]
+            if job_id in self.finished:
+                self.finished[job_id] = self.finished.pop(job_id)
+        if not future.done():
+            return {'id': job_id, 'status': 'running'}
+        if future.exception() is not None:
+            return {'id': job_id, 'status': 'failed',
+                    'error': str(future.exception())}
+        status = {'id': job_id, 'status': 'done'}
+        status.update(future.result())
+        return status
+
+    def shutdown(self):
+        self.job_runner.shutdown()
+        self.pool.shutdown()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    '''Handles the service's HTTP requests:
+    GET /health, POST /fit (fit and wait), POST /jobs (fit in the background)
+    and GET /jobs/<number> (check on a background fit). Request and response
+    bodies are JSON.
+    '''
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return BaseHTTPRequestHandler.address_string(self)
+        return 'local'
+
+    def send_json(self, code, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok',
+                                 'workers': service.pool.workers})
+        elif self.path.startswith('/jobs/'):
+            try:
+                job_id = int(self.path[6:])
+                self.send_json(200, service.job(job_id))
+            except ValueError:
+                self.send_json(404, {'error': 'No such job'})
+            except KeyError:
+                if service.expired(job_id):
+                    self.send_json(410, {'error': 'Job expired'})
+                else:
+                    self.send_json(404, {'error': 'No such job'})
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            request = self.read_json()
+            if self.path == '/fit':
+                self.send_json(200, service.fit(request))
+            elif self.path == '/jobs':
+                self.send_json(202, {'id': service.submit(request),
+                                     'status': 'running'})
+            else:
+                self.send_json(404, {'error': 'Not found'})
+        except (ValueError, KeyError, TypeError) as error:
+            self.send_json(400, {'error': 'Bad request: %s' % error})
+        except Exception as error:
+            self.send_json(500, {'error': str(error)})
+
+
+def run_service(arguments):
+    '''Serve fit requests over HTTP on localhost and/or a Unix socket (see
+    ServiceHandler) until interrupted.
+    '''
+    from http.server import ThreadingHTTPServer  # Python 3.7+
+
+    if hasattr(socketserver, 'UnixStreamServer'):  # Not on Windows
+        class UnixServiceServer(socketserver.ThreadingMixIn,
+                                socketserver.UnixStreamServer):
+            '''Serves ServiceHandler on a Unix socket.'''
+            daemon_threads = True
+
+    service = FitService(batch_settings(arguments), arguments.workers,
+                         arguments.timeout)
+    servers = []
+    if arguments.serve is not None:
+        servers.append(ThreadingHTTPServer(('127.0.0.1', arguments.serve),
+                                           ServiceHandler))
+    if arguments.socket is not None:
+        if path.exists(arguments.socket):
+            remove(arguments.socket)
+        servers.append(UnixServiceServer(arguments.socket, ServiceHandler))
+    for server in servers:
+        server.service = service
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    if arguments.socket is not None:
+        remove(arguments.socket)
+    service.shutdown()
+
+
 if __name__ == '__main__':
-    main_app = MainApp()
-    main_app.root.mainloop()
+    arguments = parse_arguments(argv[1:])
+    if arguments.log is not None:
+        message_log.log_to_file(arguments.log)
+    if arguments.serve is not None or arguments.socket is not None:
+        run_service(arguments)
+    elif arguments.watch is not None:
+        run_watch(arguments)
+    elif arguments.merge is not None:
+        merge_shards(arguments.merge)
+    elif arguments.batch is not None or arguments.append is not None:
+        run_batch(arguments)
+    else:
+        main_app = MainApp()
+        main_app.root.mainloop()
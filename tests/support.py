@@ -0,0 +1,25 @@
+'''What the tests share: PFunc and rpy2, each None if it (or one of its
+dependencies) cannot be imported, and decorators that skip the tests that
+need them.
+'''
+import sys
+import unittest
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+R_CODE = path.join(ROOT, 'PFunc_RCode.R')
+
+sys.path.insert(0, ROOT)
+try:
+    import PFunc
+except ImportError:
+    PFunc = None
+
+try:
+    import rpy2.robjects as robjects
+except ImportError:
+    robjects = None
+
+needs_pfunc = unittest.skipIf(PFunc is None,
+                              'needs PFunc and its dependencies')
+needs_r = unittest.skipIf(robjects is None, 'needs rpy2 and R')
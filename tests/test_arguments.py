@@ -0,0 +1,38 @@
+'''Tests of parse_arguments, PFunc's command line.'''
+import unittest
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from support import PFunc, needs_pfunc
+
+
+@needs_pfunc
+class ParseArgumentsTest(unittest.TestCase):
+    def test_unknown_argument_is_an_error(self):
+        with mock.patch('sys.stderr', StringIO()):
+            with self.assertRaises(SystemExit):
+                PFunc.parse_arguments(['--batch', 'data.csv', '--wokers',
+                                       '4'])
+
+    def test_finder_process_number_is_ignored(self):
+        parsed = PFunc.parse_arguments(['-psn_0_12345'])
+        self.assertIsNone(parsed.batch)
+
+    def test_shard_needs_batch(self):
+        with mock.patch('sys.stderr', StringIO()):
+            with self.assertRaises(SystemExit):
+                PFunc.parse_arguments(['--shard', '1/2'])
+        parsed = PFunc.parse_arguments(['--batch', 'data.csv', '--shard',
+                                        '2/8'])
+        self.assertEqual(parsed.shard, (2, 8))
+
+    def test_socket_needs_unix_sockets(self):
+        with mock.patch.object(PFunc, 'socketserver', SimpleNamespace()):
+            with mock.patch('sys.stderr', StringIO()):
+                with self.assertRaises(SystemExit):
+                    PFunc.parse_arguments(['--socket', 'pfunc.sock'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+'''Tests of the batch run helpers: --shard, --merge and --append.'''
+import shelve
+import sqlite3
+import tempfile
+import unittest
+from argparse import Namespace
+from os import path
+from types import SimpleNamespace
+from unittest import mock
+
+from support import PFunc, needs_pfunc
+
+
+def output_directory(test):
+    '''Return a temporary output directory that is removed after test.'''
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return directory.name
+
+
+OPTIONS = ({'tol_mode': 'broad', 'strength_mode': 'Height-Dependent'}, 0,
+           1)  # Settings, bootstrap replicates and seed (see run_batch)
+
+
+def task(id_number, name, stimulus, response, settings=OPTIONS[0]):
+    '''Return a task as read from a data file (see fit_task).'''
+    return {'id': id_number, 'name': name, 'type': 'individual',
+            'stimulus': stimulus, 'response': response, 'smoothing': '-1',
+            'settings': dict(settings), 'bootstrap': 0, 'seed': 1}
+
+
+@needs_pfunc
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        self.output = output_directory(self)
+        self.tasks = [task(i, 'female%d' % i, [1.0, 2.0], [0.5, 0.6])
+                      for i in range(1, 21)]
+
+    def test_shard_of_is_stable_and_in_range(self):
+        for count in (1, 3, 8):
+            for individual in self.tasks:
+                shard = PFunc.shard_of(individual['name'], count)
+                self.assertTrue(1 <= shard <= count)
+                self.assertEqual(shard,
+                                 PFunc.shard_of(individual['name'], count))
+
+    def save_shards(self, count):
+        for index in range(1, count + 1):
+            tasks = [individual for individual in self.tasks
+                     if PFunc.shard_of(individual['name'], count) == index]
+            results = ['result %d' % individual['id'] for individual in tasks]
+            arguments = Namespace(shard=(index, count), output=self.output,
+                                  batch='data.csv', se=False)
+            with mock.patch.object(PFunc, 'write_batch_outputs'):
+                PFunc.save_shard(arguments, OPTIONS, tasks, results, [])
+
+    def test_merge_restores_the_order_of_the_data_file(self):
+        self.save_shards(3)
+        with mock.patch.object(PFunc, 'write_batch_outputs') as write:
+            PFunc.merge_shards(self.output)
+        prefix, results, settings, with_se = write.call_args[0]
+        self.assertEqual(results, ['result %d' % i for i in range(1, 21)])
+        store = shelve.open(path.join(self.output, PFunc.BATCH_STORE))
+        self.assertEqual([individual['id'] for individual in store['tasks']],
+                         list(range(1, 21)))
+        store.close()
+
+    def test_merge_needs_every_shard(self):
+        self.save_shards(3)
+        PFunc.remove(path.join(self.output, PFunc.SHARD_STORE % (2, 3)))
+        with self.assertRaises(SystemExit):
+            PFunc.merge_shards(self.output)
+
+
+@needs_pfunc
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.output = output_directory(self)
+
+    def checkpoint(self, shard, tasks):
+        checkpoint = PFunc.BatchCheckpoint(self.output, tasks, OPTIONS,
+                                           shard)
+        self.addCleanup(checkpoint.connection.close)
+        return checkpoint
+
+    def test_shards_checkpoint_independently(self):
+        first = self.checkpoint((1, 2), [task(1, 'female1', [1.0], [0.5])])
+        second = self.checkpoint((2, 2), [task(2, 'female2', [1.0], [0.1])])
+        first.save(SimpleNamespace(id_number=1, name='female1'))
+        second.save(SimpleNamespace(id_number=2, name='female2'))
+        self.assertEqual(list(first.load()), [1])
+        self.assertEqual(list(second.load()), [2])
+        for shard in ((1, 2), (2, 2)):
+            file_name = path.join(self.output, PFunc.SHARD_CHECKPOINT % shard)
+            self.assertTrue(path.exists(file_name))
+            connection = sqlite3.connect(file_name)
+            self.assertNotEqual(
+                connection.execute('PRAGMA journal_mode').fetchone()[0],
+                'wal')
+            connection.close()
+        self.assertFalse(path.exists(path.join(self.output,
+                                               PFunc.CHECKPOINT_STORE)))
+
+    def test_finishing_one_shard_keeps_the_other(self):
+        first = self.checkpoint((1, 2), [task(1, 'female1', [1.0], [0.5])])
+        second = self.checkpoint((2, 2), [task(2, 'female2', [1.0], [0.1])])
+        first.save(SimpleNamespace(id_number=1, name='female1'))
+        second.save(SimpleNamespace(id_number=2, name='female2'))
+        first.finish()
+        self.assertEqual(list(second.load()), [2])
+
+
+@needs_pfunc
+class AppendTasksTest(unittest.TestCase):
+    def setUp(self):
+        self.output = output_directory(self)
+        tasks = [task(1, 'female1', [1.0, 2.0], [0.5, 0.6]),
+                 task(2, 'female2', [1.0, 2.0], [0.1, 0.2])]
+        PFunc.save_batch(self.output, OPTIONS, tasks, ['fit 1', 'fit 2'])
+
+    def test_new_trials_are_merged_into_the_last_run(self):
+        tasks, results = PFunc.append_tasks(
+            self.output, OPTIONS,
+            [task(1, 'female2', [3.0], [0.3]),
+             task(2, 'female1', [], []),
+             task(3, 'female3', [1.0, 2.0], [0.7, 0.8])])
+        self.assertEqual([individual['name'] for individual in tasks],
+                         ['female1', 'female2', 'female3'])
+        self.assertEqual([individual['id'] for individual in tasks],
+                         [1, 2, 3])
+        self.assertEqual(tasks[1]['stimulus'], [1.0, 2.0, 3.0])
+        self.assertEqual(tasks[1]['response'], [0.1, 0.2, 0.3])
+        # Only the individuals that gained trials are refit
+        self.assertEqual(results, ['fit 1', None, None])
+
+    def test_changed_settings_refit_everyone(self):
+        settings = dict(OPTIONS[0], tol_mode='strict')
+        tasks, results = PFunc.append_tasks(
+            self.output, (settings, 0, 1),
+            [task(1, 'female1', [], [], settings)])
+        self.assertEqual(len(tasks), 2)
+        self.assertEqual(results, [None, None])
+
+    def test_first_run_fits_everything(self):
+        tasks, results = PFunc.append_tasks(
+            output_directory(self), OPTIONS,
+            [task(1, 'female1', [1.0, 2.0], [0.5, 0.6])])
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(results, [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
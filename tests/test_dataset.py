@@ -0,0 +1,54 @@
+'''Tests of PFuncDataset, the columns of measures of a cohort.'''
+import unittest
+from types import SimpleNamespace
+
+from support import PFunc, needs_pfunc
+
+
+def individual(name, peak_pref):
+    '''Return a stand-in for a PrefFunc with the given name and peak, and
+    no other measures.
+    '''
+    measures = dict.fromkeys(PFunc.DATASET_MEASURES, None)
+    measures['peak_pref'] = peak_pref
+    return SimpleNamespace(name=name, sp_status='auto', bootstrap=None,
+                           smoothing_value=SimpleNamespace(get=lambda: 1),
+                           **measures)
+
+
+@needs_pfunc
+class RowsBetweenTest(unittest.TestCase):
+    def setUp(self):
+        peaks = [5.0, 'NA', 2.0, 8.0, None, 2.0]
+        self.dataset = PFunc.PFuncDataset.from_individuals(
+            [individual('ind%d' % n, peak) for n, peak in enumerate(peaks)])
+
+    def test_order_puts_nan_last_and_keeps_ties_in_place(self):
+        self.assertEqual(list(self.dataset.order('peak_pref')),
+                         [2, 5, 0, 3, 1, 4])
+
+    def test_no_bounds_keeps_nan_rows(self):
+        rows = self.dataset.rows_between('peak_pref', -float('inf'),
+                                         float('inf'))
+        self.assertEqual(list(rows), [2, 5, 0, 3, 1, 4])
+
+    def test_one_bound_leaves_out_nan_rows(self):
+        rows = self.dataset.rows_between('peak_pref', 2, float('inf'))
+        self.assertEqual(list(rows), [2, 5, 0, 3])
+        rows = self.dataset.rows_between('peak_pref', -float('inf'), 5)
+        self.assertEqual(list(rows), [2, 5, 0])
+
+    def test_bounds_are_inclusive(self):
+        rows = self.dataset.rows_between('peak_pref', 2, 5)
+        self.assertEqual(list(rows), [2, 5, 0])
+        rows = self.dataset.rows_between('peak_pref', 3, 4)
+        self.assertEqual(list(rows), [])
+
+    def test_order_follows_changes(self):
+        self.dataset.store(individual('ind1', 1.0), 1)
+        self.assertEqual(list(self.dataset.order('peak_pref')),
+                         [1, 2, 5, 0, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+'''Tests of FitPool, PFunc's pool of fitting processes.'''
+import unittest
+from os import _exit
+
+from support import PFunc, needs_pfunc
+
+
+def crash_on_zero(task):
+    '''Return task, but kill the worker process if it is 0.'''
+    if task == 0:
+        _exit(1)
+    return task
+
+
+@needs_pfunc
+class IsolatedImapTest(unittest.TestCase):
+    def test_crash_fails_only_its_own_task(self):
+        with PFunc.FitPool(workers=2) as pool:
+            outcomes = list(pool.isolated_imap(crash_on_zero, range(6)))
+        self.assertEqual([task for task, result, reason in outcomes],
+                         list(range(6)))
+        task, result, reason = outcomes[0]
+        self.assertIsNone(result)
+        self.assertEqual(reason, 'its worker process crashed')
+        for task, result, reason in outcomes[1:]:
+            self.assertEqual(result, task)
+            self.assertIsNone(reason)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+'''Tests of NameIndex, the search behind the Find entry.'''
+import unittest
+from types import SimpleNamespace
+
+from support import PFunc, needs_pfunc
+
+
+@needs_pfunc
+class NameIndexTest(unittest.TestCase):
+    def setUp(self):
+        names = ['Female10', 'male2', 'Female1', 'Old female', 'malefemale',
+                 'female2']
+        self.index = PFunc.NameIndex()
+        self.index.build({i: SimpleNamespace(name=name)
+                          for i, name in enumerate(names, 1)})
+
+    def test_prefix_matches_come_first(self):
+        # female1, female10 and female2 start with the query; malefemale and
+        # old female only contain it
+        self.assertEqual(self.index.search('female'), [3, 1, 6, 5, 4])
+
+    def test_search_ignores_case(self):
+        self.assertEqual(self.index.search('FEMALE1'),
+                         self.index.search('female1'))
+
+    def test_typing_more_narrows_the_matches(self):
+        self.assertEqual(self.index.search('m'), [2, 5, 3, 1, 6, 4])
+        self.assertEqual(self.index.search('ma'), [2, 5, 3, 1, 6, 4])
+        self.assertEqual(self.index.search('mal'), [2, 5, 3, 1, 6, 4])
+        self.assertEqual(self.index.search('male2'), [2, 6])
+        self.assertEqual(self.index.search('male'), [2, 5, 3, 1, 6, 4])
+        self.assertEqual(self.index.search('x'), [])
+
+    def test_added_names_are_found(self):
+        self.index.search('fem')
+        self.index.add(7, 'Femur')
+        self.assertEqual(self.index.search('fem'), [3, 1, 6, 7, 5, 4])
+        self.assertEqual(self.index.search('femu'), [7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+'''Tests of PFunc_RCode.R, run through rpy2.'''
+import unittest
+
+from support import R_CODE, needs_r, robjects
+
+
+@needs_r
+class UpdateTrialsTest(unittest.TestCase):
+    '''A refit after excluding a trial (see PrefFunc.toggle_trial) must be
+    the fit that the remaining trials would get from scratch.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        robjects.r['source'](R_CODE)
+        robjects.r('''
+          set.seed(1)
+          # Three trials at each of 11 stimuli, and one at the 12th
+          test.stimulus <- c(rep(1:11, each = 3), 12)
+          test.response <- exp(-(test.stimulus - 6) ^ 2 / 8) +
+                           rnorm(length(test.stimulus), sd = 0.1)
+          ToggledAndCold <- function(engine, drop) {
+            stimulus <- test.stimulus
+            response <- test.response
+            aggregated <- AggregateTrials(stimulus, response)
+            fit <- FitPreferenceFunction(data.frame(stimulus, response), 2,
+                                         -1, 0.5, aggregated, engine)
+            fit <- WithWarmSetup(fit, aggregated, -1, engine)
+            toggled <- UpdateTrials(fit, stimulus[drop], response[drop], -1,
+                                    stimulus[-drop], response[-drop])
+            kept <- AggregateTrials(stimulus[-drop], response[-drop])
+            refit <- WarmFit(toggled, kept, 0.5, -1, engine)
+            warm <- !is.null(refit)
+            cold <- FitPreferenceFunction(
+              data.frame(stimulus = stimulus[-drop],
+                         response = response[-drop]),
+              2, -1, 0.5, kept, engine)
+            if (!warm) {
+              refit <- cold  # What Diagnose falls back to
+            }
+            grid <- seq(1, 11, length.out = 50)
+            return(c(warm, max(abs(SplinePredict(refit, grid) -
+                                   SplinePredict(cold, grid)))))
+          }
+        ''')
+
+    def toggled_and_cold(self, engine, drop):
+        outcome = robjects.r('ToggledAndCold("%s", %d)' % (engine, drop))
+        return bool(outcome[0]), outcome[1]
+
+    def test_same_stimulus_levels_refit_warm(self):
+        for engine in ('tprs', 'pspline'):
+            warm, difference = self.toggled_and_cold(engine, 1)
+            self.assertTrue(warm, engine)
+            self.assertLess(difference, 1e-6, engine)
+
+    def test_changed_stimulus_levels_refit_cold(self):
+        # The 34th trial is the only one at stimulus 12
+        for engine in ('tprs', 'pspline'):
+            warm, difference = self.toggled_and_cold(engine, 34)
+            self.assertFalse(warm, engine)
+            self.assertEqual(difference, 0, engine)
+
+
+
+@needs_r
+class CohortPeaksTest(unittest.TestCase):
+    '''A peak recomputed for the whole cohort must be the one that Peak
+    finds for a fresh fit.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        robjects.r['source'](R_CODE)
+        robjects.r('''
+          set.seed(2)
+          cohort.stimulus <- rep(seq(1, 11, by = 0.5), each = 2)
+          CohortAndSingle <- function(engine) {
+            models <- lapply(c(4, 6, 8), function(centre) {
+              response <- exp(-(cohort.stimulus - centre) ^ 2 / 8) +
+                          rnorm(length(cohort.stimulus), sd = 0.1)
+              aggregated <- AggregateTrials(cohort.stimulus, response)
+              return(FitPreferenceFunction(
+                data.frame(stimulus = cohort.stimulus, response),
+                2, -1, -1, aggregated, engine))
+            })
+            ranges <- lapply(models, function(model) {
+              return(range(cohort.stimulus))
+            })
+            cohort <- CohortPeaks(models, ranges, list(FALSE, FALSE, FALSE),
+                                  1)
+            single <- sapply(models, function(model) {
+              return(Peak(cohort.stimulus, model, 1, FALSE)$peak.preference)
+            })
+            # CohortPeaks formats its values for the GUI (see GuiFormat)
+            return(max(abs(as.numeric(cohort$peak.preference) - single)))
+          }
+        ''')
+
+    def test_cohort_peaks_match_peak(self):
+        for engine in ('tprs', 'pspline'):
+            difference = robjects.r('CohortAndSingle("%s")' % engine)[0]
+            self.assertLess(difference, 1e-5, engine)
+
+
+
+@needs_r
+class CompactModelTest(unittest.TestCase):
+    '''A compact model (see CompactModel) must predict like the gam object it
+    came from, and must not grow with the number of trials.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        robjects.r['source'](R_CODE)
+        robjects.r('''
+          set.seed(3)
+          FitWithTrials <- function(repeats) {
+            stimulus <- rep(1:11, each = repeats)
+            response <- exp(-(stimulus - 6) ^ 2 / 8) +
+                        rnorm(length(stimulus), sd = 0.1)
+            aggregated <- AggregateTrials(stimulus, response)
+            fit <- FitPreferenceFunction(data.frame(stimulus, response), 2,
+                                         -1)
+            return(WithWarmSetup(fit, aggregated, -1, "tprs"))
+          }
+          compact.grid <- seq(1, 11, length.out = 37)
+          full.fit <- FitWithTrials(20)
+          compact.fit <- CompactModel(full.fit)
+        ''')
+
+    def test_compact_model_predicts_like_gam(self):
+        basis_difference = robjects.r('''
+          max(abs(SplineBasis(compact.fit, compact.grid) -
+                  predict.gam(full.fit, data.frame(stimulus = compact.grid),
+                              type = "lpmatrix")))
+        ''')[0]
+        prediction_difference = robjects.r('''
+          max(abs(SplinePredict(compact.fit, compact.grid) -
+                  predict.gam(full.fit,
+                              data.frame(stimulus = compact.grid))))
+        ''')[0]
+        self.assertLess(basis_difference, 1e-10)
+        self.assertLess(prediction_difference, 1e-10)
+
+    def test_compact_model_is_smaller_and_does_not_grow(self):
+        full_size, compact_size, larger_size = robjects.r('''
+          c(object.size(full.fit), object.size(compact.fit),
+            object.size(CompactModel(FitWithTrials(200))))
+        ''')
+        self.assertLess(compact_size, full_size / 2)
+        self.assertEqual(larger_size, compact_size)
+
+    def test_warm_setup_keeps_no_basis(self):
+        self.assertTrue(robjects.r('is.null(compact.fit$warm.setup$X)')[0])
+
+
+
+@needs_r
+class ReplicateMeasuresTest(unittest.TestCase):
+    '''The peaks and tolerances of bootstrap replicates (see BootstrapSpline)
+    must be measured as Peak and Tolerance measure the fitted spline. Applied
+    to the fitted coefficients themselves, they must give the estimates.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        robjects.r['source'](R_CODE)
+        robjects.r('''
+          set.seed(4)
+          replicate.stimulus <- rep(seq(1, 11, by = 0.5), each = 3)
+          replicate.response <- exp(-(replicate.stimulus - 6) ^ 2 / 8) +
+                                rnorm(length(replicate.stimulus), sd = 0.05)
+          ReplicateAndEstimate <- function(engine) {
+            fit <- FitPreferenceFunction(
+              data.frame(stimulus = replicate.stimulus,
+                         response = replicate.response), 2, -1, -1,
+              engine = engine)
+            beta <- matrix(coef(fit), ncol = 1)
+            Curves <- function(x, columns, derivs = 0) {
+              return(rowSums(SplineBasis(fit, x, derivs) *
+                             t(beta[, columns, drop = FALSE])))
+            }
+            stimulus <- AdaptiveGrid(fit, 1, 11)$stimulus
+            fits <- SplineBasis(fit, stimulus) %*% beta
+            peaks <- RefineGridPeaks(fit, Curves, stimulus, fits,
+                                     GridPeaks(stimulus, fits, 1))
+            tolerances <- GridTolerances(stimulus, fits, peaks, 1 / 3, 0,
+                                         Curves)
+            peak.bundle <- Peak(replicate.stimulus, fit, 1, FALSE)
+            tolerance.bundle <- Tolerance(1 / 3, peak.bundle, FALSE, fit, 0)
+            return(c(peaks$preference - peak.bundle$peak.preference,
+                     peaks$response - peak.bundle$peak.response,
+                     tolerances$strict - tolerance.bundle$strict.tolerance,
+                     tolerances$broad - tolerance.bundle$broad.tolerance))
+          }
+        ''')
+
+    def test_replicate_measures_match_the_estimates(self):
+        for engine in ('tprs', 'pspline'):
+            peak, height, strict, broad = robjects.r(
+                'ReplicateAndEstimate("%s")' % engine)
+            self.assertLess(abs(peak), 1e-6, engine)
+            self.assertLess(abs(height), 1e-9, engine)
+            # Tolerance places each crossing within 1/20000 of the range
+            self.assertLess(abs(strict), 1e-3, engine)
+            self.assertLess(abs(broad), 1e-3, engine)
+
+
+if __name__ == '__main__':
+    unittest.main()